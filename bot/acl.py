@@ -0,0 +1,145 @@
+import fnmatch
+import re
+
+# Access control rules compiled for lookups that don't depend on how many channels
+# and users are allowed. The rules use errbot's ACCESS_CONTROLS format, the first
+# 'plugin:command' pattern matching a command gives its rule, see the accessControl plugin
+
+# Rule keys holding lists of patterns, the other keys are flags like allowmuc
+LIST_KEYS = ('allowusers', 'denyusers', 'allowrooms', 'denyrooms', 'allowargs', 'denyargs')
+
+# Results of the wildcard patterns kept by each matcher, it's cleared once full
+MATCH_CACHE_SIZE = 10000
+
+
+def parse_list(text):
+    """Splits a comma separated list of the SSM parameters, ignoring spaces and empty entries"""
+
+    return [item for item in text.replace(' ', '').split(',') if item]
+
+
+def access_controls(allowed_channels, allowed_users, command_rules=None):
+    """Builds the ACCESS_CONTROLS of the bot from the allowed channels and users
+    lists, which apply to every command, after the given per command rules"""
+
+    controls = dict(command_rules or {})
+    default = dict(controls.pop('*', {}))
+    default.update({'allowrooms': parse_list(allowed_channels), 'allowusers': parse_list(allowed_users)})
+    controls['*'] = default
+    return controls
+
+
+class Matcher(object):
+    """Unix glob patterns, like errbot's ACLs use, split into a set of the exact
+    names and a single regex for the patterns with wildcards"""
+
+    def __init__(self, patterns, ignore_case=False):
+        if isinstance(patterns, str):
+            patterns = (patterns,)
+        patterns = [str(pattern).lower() if ignore_case else str(pattern) for pattern in patterns]
+
+        self.ignore_case = ignore_case
+        self.exact = frozenset(pattern for pattern in patterns if not re.search(r'[*?\[]', pattern))
+        wildcards = [fnmatch.translate(pattern) for pattern in patterns if pattern not in self.exact]
+        self.wildcards = re.compile('|'.join(wildcards)) if wildcards else None
+        self._matches = {}
+
+    def __contains__(self, text):
+
+        text = str(text)
+        if self.ignore_case:
+            text = text.lower()
+        if text in self.exact:
+            return True
+        if self.wildcards is None:
+            return False
+
+        match = self._matches.get(text)
+        if match is None:
+            if len(self._matches) >= MATCH_CACHE_SIZE:
+                self._matches.clear()
+            match = self._matches[text] = self.wildcards.match(text) is not None
+        return match
+
+
+class Rule(object):
+    """The rule of a command, each list of patterns compiled into a Matcher"""
+
+    def __init__(self, controls):
+        self.controls = controls
+        self.matchers = {key: Matcher(controls[key]) for key in LIST_KEYS if key in controls}
+
+    def allows(self, key, text):
+        return key not in self.matchers or text in self.matchers[key]
+
+    def denies(self, key, text):
+        return key in self.matchers and text in self.matchers[key]
+
+    def get(self, key, default=None):
+        return self.controls.get(key, default)
+
+
+class AccessRules(object):
+    """Compiled ACCESS_CONTROLS. The rule of each command is resolved once, and
+    the users and rooms are checked against sets, so a check costs the same
+    with a handful or thousands of allowed channels and users"""
+
+    def __init__(self, controls, defaults=None, admins=()):
+        self.defaults = dict(defaults or {})
+        self.controls = controls
+        self.patterns = [
+            (Matcher(pattern if ':' in pattern else '*:' + pattern, ignore_case=True), rule)
+            for pattern, rule in controls.items()
+        ]
+        self.admins = Matcher(admins)
+        self._rules = {}
+
+    def rule(self, command):
+        """Returns the rule of a 'plugin:command', the defaults updated by the first matching pattern"""
+
+        rule = self._rules.get(command)
+        if rule is None:
+            controls = dict(self.defaults)
+            for pattern, pattern_controls in self.patterns:
+                if command in pattern:
+                    controls.update(pattern_controls)
+                    break
+            rule = self._rules[command] = Rule(controls)
+        return rule
+
+    def check(self, command, user, room=None, args='', admin_only=False):
+        """Returns why user can't run the 'plugin:command' with args from room,
+        None for a direct message, or None when it's allowed"""
+
+        rule = self.rule(command)
+
+        if not rule.allows('allowargs', args) or rule.denies('denyargs', args):
+            return "You're not allowed to access this command using the provided arguments"
+
+        if not rule.allows('allowusers', user) or rule.denies('denyusers', user):
+            return "You're not allowed to access this command from this user"
+
+        if room is not None:
+            if rule.get('allowmuc') is False:
+                return "You're not allowed to access this command from a chatroom"
+            if not rule.allows('allowrooms', room) or rule.denies('denyrooms', room):
+                return "You're not allowed to access this command from this room"
+        elif rule.get('allowprivate') is False:
+            return "You're not allowed to access this command via private message to me"
+
+        if admin_only:
+            if user not in self.admins:
+                return "This command requires bot-admin privileges"
+            # Admin commands are direct message only unless allowmuc is set for them
+            if room is not None and not rule.get('allowmuc', False):
+                return "This command may only be issued through a direct message"
+
+        return None
+
+    def stats(self):
+        """Returns how many patterns each list of the default rule has, and the commands resolved so far"""
+
+        default = self.controls.get('*', {})
+        stats = {key: len(default[key]) for key in LIST_KEYS if key in default}
+        stats['commands'] = len(self._rules)
+        return stats
@@ -0,0 +1,81 @@
+"""Compares loading the bot parameters at startup one GetParameter call at a time, the way
+config_env used to, with the batched loader and with the lazy secrets provider,
+against a local SSM stand-in.
+
+    python benchmarks/bench_config_env.py --latency 0.05
+"""
+import argparse
+import base64
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fake_ssm import FakeSSM
+from ssm_parameters import SSM_PARAMETERS, SecretsProvider, load_fernet, load_parameters
+
+# The parameters config.py needs to connect, the only ones the lazy provider loads at startup
+STARTUP_VARIABLES = ['DEBUG', 'SLACK_TOKEN', 'BOT_PREFIXES', 'ACL_ALLOWED_CHANNELS', 'ACL_ALLOWED_USERS']
+
+
+def load_sequential(ssm_client, manifest):
+
+    return {
+        variable: ssm_client.get_parameter(Name=name, WithDecryption=True)['Parameter']['Value']
+        for variable, name in manifest
+    }
+
+
+def measure(name, load, ssm_client):
+
+    ssm_client.calls = 0
+    time_start = time.perf_counter()
+    values = load(ssm_client, SSM_PARAMETERS)
+    elapsed = time.perf_counter() - time_start
+
+    print("{:<26} {:>6.2f}s {:>4} calls {:>4} parameters".format(name, elapsed, ssm_client.calls, len(values)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05)
+    options = parser.parse_args()
+
+    parameters = {name: "value of {}".format(name) for _, name in SSM_PARAMETERS}
+    # Other parameters of the account the by path fallback has to walk through
+    parameters.update({"/other/parameter-{}".format(index): "x" for index in range(40)})
+
+    print("{} parameters, {:.0f}ms per SSM call".format(len(SSM_PARAMETERS), options.latency * 1000))
+
+    measure("sequential GetParameter", load_sequential, FakeSSM(parameters, options.latency))
+    measure("batched GetParameters", load_parameters, FakeSSM(parameters, options.latency))
+
+    class NoBatchSSM(FakeSSM):
+        def get_parameters(self, Names, WithDecryption=False):
+            self.call()
+            raise RuntimeError("AccessDenied")
+
+    measure("GetParametersByPath", load_parameters, NoBatchSSM(parameters, options.latency))
+
+    def lazy_startup(ssm_client, manifest, cache_path=None, cache_key=None):
+        secrets = SecretsProvider(lambda: ssm_client, manifest, cache_path=cache_path, cache_key=cache_key)
+        return secrets.load(STARTUP_VARIABLES)
+
+    measure("lazy startup", lazy_startup, FakeSSM(parameters, options.latency))
+
+    cache_key = base64.urlsafe_b64encode(os.urandom(32))
+    if load_fernet(cache_key) is not None:
+        cache_path = os.path.join(tempfile.mkdtemp(), "secrets.cache")
+        lazy_startup(FakeSSM(parameters, 0), SSM_PARAMETERS, cache_path, cache_key)
+
+        measure(
+            "lazy warm start",
+            lambda ssm_client, manifest: lazy_startup(ssm_client, manifest, cache_path, cache_key),
+            FakeSSM(parameters, options.latency)
+        )
+
+
+if __name__ == "__main__":
+    main()
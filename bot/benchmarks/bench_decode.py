@@ -0,0 +1,96 @@
+"""Compares the peak RSS of decoding actiontemplates/All whole with json.loads against the
+streaming, field selecting decoder of the octopus helpers. Each mode runs in its own process
+so the peak of one doesn't hide the other.
+
+    python benchmarks/bench_decode.py --templates 3000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BOT_DIR)
+
+from benchmarks.fake_octopus import FakeOctopus
+
+
+def max_rss_mb():
+    """Peak RSS of this process. ru_maxrss survives exec on Linux, so VmHWM is used when available"""
+
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode):
+    """Decodes the template list in the given mode, printing the RSS as JSON"""
+
+    import requests
+    from commands._helpers import octopus
+
+    url = os.environ["OCTOPUS_API_URL"] + "/api/Spaces-1/actiontemplates/All"
+    rss_before = max_rss_mb()
+    time_start = time.perf_counter()
+
+    if mode == "json.loads":
+        templates = json.loads(requests.get(url).content)
+    else:
+        templates = octopus.get_step_template_list()
+
+    print(json.dumps({
+        "templates": len(templates),
+        "seconds": time.perf_counter() - time_start,
+        "rss_before": rss_before,
+        "rss_after": max_rss_mb()
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--templates", type=int, default=3000)
+    parser.add_argument("--mode")
+    options = parser.parse_args()
+
+    if options.mode:
+        run_mode(options.mode)
+        return
+
+    fake_octopus = FakeOctopus(templates=options.templates, latency=0)
+    environment = dict(
+        os.environ,
+        OCTOPUS_API_URL=fake_octopus.start(),
+        OCTOPUS_API_KEY=os.environ.get("OCTOPUS_API_KEY", "API-BENCHMARK")
+    )
+
+    from commands._helpers import json_decode
+    print("{} templates, ijson {}, orjson {}".format(
+        options.templates,
+        "yes" if json_decode.ijson is not None else "no",
+        "yes" if json_decode.loads is not json.loads else "no"
+    ))
+
+    for mode in ("json.loads", "streaming"):
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode, "--templates", str(options.templates)],
+            env=environment, cwd=BOT_DIR
+        )
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        print("{:<12} {:>6.2f}s  RSS {:>6.1f} MB -> {:>6.1f} MB (+{:.1f} MB)".format(
+            mode, result["seconds"], result["rss_before"], result["rss_after"],
+            result["rss_after"] - result["rss_before"]
+        ))
+
+    fake_octopus.stop()
+
+
+if __name__ == "__main__":
+    main()
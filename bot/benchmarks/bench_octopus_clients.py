@@ -0,0 +1,57 @@
+"""Compares the blocking octopus helpers with the asyncio client against a local fake Octopus.
+
+    python benchmarks/bench_octopus_clients.py --templates 500 --projects 200 --latency 0.05
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fake_octopus import FakeOctopus
+
+
+def measure(fake_octopus, name, function, *args):
+
+    fake_octopus.reset()
+    time_start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - time_start
+
+    print("{:<40} {:>8.2f}s {:>6} requests".format(name, elapsed, fake_octopus.request_count))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--templates", type=int, default=500)
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    options = parser.parse_args()
+
+    fake_octopus = FakeOctopus(options.templates, options.projects, latency=options.latency)
+    os.environ["OCTOPUS_API_URL"] = fake_octopus.start()
+    os.environ.setdefault("OCTOPUS_API_KEY", "API-BENCHMARK")
+
+    from commands._helpers import octopus, octopus_async
+
+    usage_urls = [template["Links"]["Usage"] for template in fake_octopus.step_templates()]
+
+    print("{} templates, {} projects, {:.0f}ms latency".format(options.templates, options.projects, options.latency * 1000))
+
+    # The response cache is dropped before each run so both clients hit the server
+    octopus.cached_session.invalidate()
+    measure(fake_octopus, "sync  get_template_usage_list", octopus.get_template_usage_list, usage_urls)
+    measure(fake_octopus, "async get_template_usage_list", octopus_async.get_template_usage_list, usage_urls)
+
+    octopus.cached_session.invalidate()
+    measure(fake_octopus, "sync  get_release_statuses", octopus.get_release_statuses)
+    measure(fake_octopus, "async get_release_statuses", octopus_async.get_release_statuses)
+
+    octopus_async.run(octopus_async.client.close())
+    fake_octopus.stop()
+
+
+if __name__ == "__main__":
+    main()
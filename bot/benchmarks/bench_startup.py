@@ -0,0 +1,67 @@
+"""Profiles what the bot imports at startup: errbot, config_env with its SSM client and
+every plugin, in a fresh process, reporting the import time and memory of each plugin
+and of the slowest modules. The SSM parameters come from a local stand-in.
+
+    python benchmarks/bench_startup.py --latency 0.05
+"""
+import argparse
+import glob
+import importlib
+import os
+import subprocess
+import sys
+
+BOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def run_profile(latency):
+    """Imports what the bot imports at startup with the profile enabled, printing the report"""
+
+    sys.path.insert(0, BOT_DIR)
+
+    import startup_profile
+    startup_profile.enable()
+
+    import errbot
+    startup_profile.mark('errbot imported')
+
+    from benchmarks.fake_ssm import FakeSSM
+    import ssm_parameters
+
+    parameters = {name: "value" for _, name in ssm_parameters.SSM_PARAMETERS}
+    secrets = ssm_parameters.install(ssm_parameters.SecretsProvider(lambda: FakeSSM(parameters, latency)))
+    os.environ.update(secrets.load(['DEBUG', 'SLACK_TOKEN', 'BOT_PREFIXES', 'ACL_ALLOWED_CHANNELS', 'ACL_ALLOWED_USERS']))
+    startup_profile.mark('config loaded')
+
+    for plugin_file in sorted(glob.glob(os.path.join(BOT_DIR, "commands", "*", "*.plug"))):
+        plugin_dir = os.path.basename(os.path.dirname(plugin_file))
+        module = os.path.splitext(os.path.basename(plugin_file))[0]
+        with open(plugin_file) as plug:
+            for line in plug:
+                if line.strip().lower().startswith("module"):
+                    module = line.split("=", 1)[1].strip()
+        importlib.import_module("commands.{}.{}".format(plugin_dir, module))
+
+    startup_profile.mark('plugins imported')
+    print("\n".join(startup_profile.report()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--profile", action="store_true")
+    options = parser.parse_args()
+
+    if options.profile:
+        run_profile(options.latency)
+        return
+
+    # A fresh process, so nothing is imported yet
+    subprocess.check_call(
+        [sys.executable, os.path.abspath(__file__), "--profile", "--latency", str(options.latency)],
+        cwd=BOT_DIR
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmarks the step command (StepTemplate.get_step_update_status) end to end against
+a local fake Octopus and Slack, reporting wall time, the part of it spent posting
+to Slack, request count and peak memory.
+
+    python benchmarks/bench_step_status.py --scales 10 100 1000 --latency 0.02
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fake_octopus import FakeOctopus
+
+
+class FakeBot(object):
+    """The parts of the errbot backend the plugins use"""
+
+    def __init__(self, data_dir):
+        self.bot_config = SimpleNamespace(BOT_DATA_DIR=data_dir, BOT_ADMINS=())
+        self.repo_manager = SimpleNamespace(plugin_dir=data_dir)
+
+    def add_reaction(self, msg, reaction):
+        pass
+
+    def remove_reaction(self, msg, reaction):
+        pass
+
+
+def run_command(plugin, command):
+
+    from commands.stepTemplate.stepStatus import StepTemplate
+
+    pattern = StepTemplate.get_step_update_status._err_command_re_pattern
+    msg = SimpleNamespace(frm=SimpleNamespace(channelid="C0BENCHMARK"))
+    # Run the command itself rather than queue it on its worker pool, to time it
+    return list(StepTemplate.get_step_update_status.__wrapped__(plugin, msg, pattern.search(command)))
+
+
+def slack_time():
+    """Seconds spent in Slack calls so far, the posts are timed apart from the command"""
+
+    from commands._helpers import slack
+
+    return sum(stats['avg_latency'] * stats['calls'] for stats in slack.call_stats().values())
+
+
+def measure(fake_octopus, name, plugin, command):
+
+    fake_octopus.reset()
+    tracemalloc.start()
+    slack_start = slack_time()
+    time_start = time.perf_counter()
+
+    run_command(plugin, command)
+
+    elapsed = time.perf_counter() - time_start
+    posting = slack_time() - slack_start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("{:<28} {:>8.2f}s {:>6.2f}s posting {:>6} requests {:>3} posts {:>8.1f} MB peak".format(
+        name, elapsed, posting, fake_octopus.request_count, len(fake_octopus.slack_messages), peak / 1024 / 1024
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--usages", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02)
+    options = parser.parse_args()
+
+    fake_octopus = FakeOctopus(usages=options.usages, latency=options.latency)
+    base_url = fake_octopus.start()
+    os.environ["OCTOPUS_API_URL"] = base_url
+    os.environ["SLACK_API_URL"] = base_url + "/slack/api/"
+    os.environ.setdefault("OCTOPUS_API_KEY", "API-BENCHMARK")
+    os.environ.setdefault("SLACK_MEESEEKS_API_KEY", "xoxb-benchmark")
+
+    from commands._helpers import octopus, slack, warm_cache
+    from commands.stepTemplate.stepStatus import StepTemplate
+
+    # The stub Slack isn't rate limited, lifting the client side limits keeps the
+    # 1 message per second of a channel out of the time of the command
+    for tier in slack.SLACK_TIER_RATES:
+        slack.SLACK_TIER_RATES[tier] = 1000.0
+
+    print("{} usages per template, {:.0f}ms latency".format(options.usages, options.latency * 1000))
+
+    for scale in options.scales:
+        data_dir = tempfile.mkdtemp()
+        fake_octopus.templates = scale
+
+        plugin = StepTemplate(FakeBot(data_dir), "stepTemplate")
+        plugin.register_precompute()
+
+        octopus.cached_session.invalidate()
+        measure(fake_octopus, "{} templates cold".format(scale), plugin, "step --fresh")
+
+        # The snapshot is kept, only the template list has to be fetched again
+        octopus.cached_session.invalidate()
+        warm_cache._values.pop('step_report', None)
+        measure(fake_octopus, "{} templates incremental".format(scale), plugin, "step")
+
+        measure(fake_octopus, "{} templates warm".format(scale), plugin, "step")
+
+        shutil.rmtree(data_dir)
+
+    print("max RSS {:.1f} MB".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+    fake_octopus.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Local stand-in for the Octopus API, serving synthetic payloads at a configurable
+scale and latency so the helpers can be benchmarked without a real server.
+It also stubs the Slack Web API methods the bot posts with under /slack/api/.
+
+    python benchmarks/fake_octopus.py --templates 100 --latency 0.05
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+
+class FakeOctopus(object):
+    """Synthetic Octopus space with the given number of step templates and projects"""
+
+    def __init__(self, templates=100, projects=200, usages=10, latency=0.05, project_groups=('63', '241', '106', '21')):
+        self.templates = templates
+        self.projects = projects
+        self.usages = usages
+        self.latency = latency
+        self.project_groups = list(project_groups)
+        self.request_count = 0
+        self.slack_messages = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def count_request(self):
+
+        with self._lock:
+            self.request_count += 1
+
+    def reset(self):
+
+        with self._lock:
+            self.request_count = 0
+            self.slack_messages = []
+
+    def slack_api(self, method, payload):
+        """Answers a Slack Web API call like Slack does, recording the posted messages"""
+
+        with self._lock:
+            self.slack_messages.append((method, payload))
+            ts = "1625130000.{:06d}".format(len(self.slack_messages))
+
+        if method in ("chat.postMessage", "chat.update"):
+            return {"ok": True, "channel": payload.get("channel"), "ts": payload.get("ts", ts)}
+        if method == "conversations.info":
+            return {"ok": True, "channel": {"id": payload.get("channel"), "topic": {"value": "Open incidents: none |"}}}
+        return {"ok": False, "error": "unknown_method"}
+
+    def step_templates(self):
+
+        return [
+            {
+                "Id": "ActionTemplates-{}".format(index),
+                "Name": "Step Template {}".format(index),
+                "Version": 5,
+                "CommunityActionTemplateId": None if index % 10 else "CommunityActionTemplates-{}".format(index),
+                "Links": {
+                    "Self": "/api/Spaces-1/actiontemplates/ActionTemplates-{}".format(index),
+                    "Usage": "/api/Spaces-1/actiontemplates/ActionTemplates-{}/usage".format(index)
+                },
+                "Parameters": [{"Name": "Parameter{}".format(parameter), "Label": "x" * 40} for parameter in range(5)],
+                "Properties": {"Octopus.Action.Script.ScriptBody": "x" * 2000}
+            }
+            for index in range(self.templates)
+        ]
+
+    def template_usage(self, template_id):
+
+        return [
+            {
+                "ProjectId": "Projects-{}".format(index),
+                "ProjectName": "Project {}".format(index),
+                "ProjectSlug": "project-{}".format(index),
+                "Version": str(index % 6),
+                "StepName": "Step for {}".format(template_id)
+            }
+            for index in range(self.usages)
+        ]
+
+    def project(self, index):
+
+        return {
+            "Id": "Projects-{}".format(index),
+            "Name": "Project {}".format(index),
+            "Slug": "project-{}".format(index),
+            "ProjectGroupId": "ProjectGroups-{}".format(self.project_groups[index % len(self.project_groups)]),
+            "Links": {"Self": "/api/projects/Projects-{}".format(index)}
+        }
+
+    def group_projects(self, group_id):
+
+        group_index = self.project_groups.index(group_id)
+        return [
+            self.project(index) for index in range(self.projects)
+            if index % len(self.project_groups) == group_index
+        ]
+
+    def releases(self, project_id):
+
+        number = int(project_id.split("-")[1])
+        return [
+            {
+                "Id": "Releases-{}-{}".format(number, release),
+                "Version": "1.0.{}".format(release),
+                "Assembled": "2021-07-01T10:00:00.000+00:00",
+                "ProjectId": project_id
+            }
+            for release in range(20, 0, -1)
+        ]
+
+    def progression(self, release_id):
+
+        return {
+            "Phases": [
+                {"Name": "Development", "Progress": "Complete"},
+                {"Name": "Test", "Progress": "Current"},
+                {"Name": "Production", "Progress": "Pending"}
+            ]
+        }
+
+    @staticmethod
+    def page(path, items, query):
+
+        skip = int(query.get("skip", 0))
+        take = int(query.get("take", 30))
+        links = {"Self": path}
+        if skip + take < len(items):
+            links["Page.Next"] = "{}?skip={}&take={}".format(path, skip + take, take)
+
+        return {
+            "ItemsPerPage": take,
+            "TotalResults": len(items),
+            "Items": items[skip:skip + take],
+            "Links": links
+        }
+
+    def route(self, path, query):
+        """Returns the payload for an API path, None when it's unknown"""
+
+        parts = path.strip("/").split("/")
+
+        if path == "/api/Spaces-1/actiontemplates/All":
+            return self.step_templates()
+        if len(parts) == 5 and parts[:3] == ["api", "Spaces-1", "actiontemplates"] and parts[4] == "usage":
+            return self.template_usage(parts[3])
+        if len(parts) == 4 and parts[:2] == ["api", "projectgroups"] and parts[3] == "projects":
+            return self.page(path, self.group_projects(parts[2].replace("ProjectGroups-", "")), query)
+        if path == "/api/projects/all":
+            return [self.project(index) for index in range(self.projects)]
+        if len(parts) == 3 and parts[:2] == ["api", "projects"]:
+            return self.project(int(parts[2].split("-")[-1]))
+        if len(parts) == 4 and parts[:2] == ["api", "projects"] and parts[3] == "releases":
+            return self.page(path, self.releases(parts[2]), query)
+        if len(parts) == 4 and parts[:2] == ["api", "releases"] and parts[3] == "progression":
+            return self.progression(parts[2])
+
+        return None
+
+    def handler(self):
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+
+                fake.count_request()
+                time.sleep(fake.latency)
+
+                url = urlsplit(self.path)
+                payload = fake.route(url.path, dict(parse_qsl(url.query)))
+
+                if payload is None:
+                    self.send_json(404, {"ErrorMessage": "The resource you requested was not found."})
+                else:
+                    self.send_json(200, payload)
+
+            def do_POST(self):
+
+                url = urlsplit(self.path)
+                if not url.path.startswith("/slack/api/"):
+                    self.send_json(404, {"ErrorMessage": "The resource you requested was not found."})
+                    return
+
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    payload = json.loads(body or "{}")
+                else:
+                    payload = dict(parse_qsl(body))
+
+                self.send_json(200, fake.slack_api(url.path[len("/slack/api/"):], payload))
+
+            def send_json(self, status, payload):
+
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self, port=0):
+        """Starts serving on a background thread, returning the base url"""
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self.handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return "http://127.0.0.1:{}".format(self._server.server_address[1])
+
+    def stop(self):
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--templates", type=int, default=100)
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--usages", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    options = parser.parse_args()
+
+    fake_octopus = FakeOctopus(options.templates, options.projects, options.usages, options.latency)
+    print("Fake Octopus listening on {}".format(fake_octopus.start(options.port)))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake_octopus.stop()
@@ -0,0 +1,48 @@
+"""Local stand-in for the boto3 SSM client with a fixed latency per call, so the
+startup parameter loading can be benchmarked without AWS."""
+import threading
+import time
+
+
+class FakeSSM(object):
+    """SSM client answering the parameters of a dict, each call sleeps latency seconds"""
+
+    def __init__(self, parameters, latency=0.05, page_size=10):
+        self.parameters = parameters
+        self.latency = latency
+        self.page_size = page_size
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def call(self):
+
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+    def get_parameter(self, Name, WithDecryption=False):
+
+        self.call()
+        return {'Parameter': {'Name': Name, 'Value': self.parameters[Name]}}
+
+    def get_parameters(self, Names, WithDecryption=False):
+
+        self.call()
+        if len(Names) > 10:
+            raise ValueError("Member must have length less than or equal to 10")
+        return {
+            'Parameters': [{'Name': name, 'Value': self.parameters[name]} for name in Names if name in self.parameters],
+            'InvalidParameters': [name for name in Names if name not in self.parameters]
+        }
+
+    def get_parameters_by_path(self, Path, Recursive=False, WithDecryption=False, NextToken=None):
+
+        self.call()
+        names = sorted(name for name in self.parameters if name.startswith(Path))
+        start = int(NextToken or 0)
+        response = {
+            'Parameters': [{'Name': name, 'Value': self.parameters[name]} for name in names[start:start + self.page_size]]
+        }
+        if start + self.page_size < len(names):
+            response['NextToken'] = str(start + self.page_size)
+        return response
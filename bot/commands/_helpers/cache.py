@@ -0,0 +1,279 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from commands._helpers.datastore import Table
+from commands._helpers.json_decode import decode_response
+from commands._helpers.singleflight import Group
+
+
+class CacheEntry(object):
+
+    __slots__ = ('value', 'expires', 'etag', 'last_modified')
+
+    def __init__(self, value, expires, etag=None, last_modified=None):
+        self.value = value
+        self.expires = expires
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_fresh(self):
+        return self.expires > time.time()
+
+
+class LRUCache(object):
+    """Thread safe LRU cache where each entry expires after its own TTL.
+    Expired entries are kept until evicted so they can still be revalidated.
+    Its counters are only updated under its lock"""
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_entry(self, key):
+        """Returns the entry for the key, fresh or not, without counting a hit or a miss"""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get(self, key, default=None):
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if entry is None or not entry.is_fresh():
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return entry.value
+
+    def count(self, hits=0, misses=0, revalidated=0):
+        """Adds to the counters, for the callers looking entries up with get_entry"""
+
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.revalidated += revalidated
+
+    def set(self, key, value, ttl, etag=None, last_modified=None):
+
+        entry = CacheEntry(value, time.time() + ttl, etag, last_modified)
+        evicted = []
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted.append(self._entries.popitem(last=False)[0])
+                self.evictions += 1
+        if evicted:
+            self.evicted(evicted)
+        return entry
+
+    def evicted(self, keys):
+        """Called with the keys evicted by a set, outside of the lock"""
+
+    def pop(self, key, default=None):
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry.value if entry is not None else default
+
+    def clear(self, *prefixes):
+        """Drops the entries whose key starts with one of the prefixes, every entry when none is given"""
+
+        with self._lock:
+            if not prefixes:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key.startswith(prefixes)]:
+                del self._entries[key]
+
+    def expire(self, *prefixes):
+        """Marks the entries whose key starts with one of the prefixes as expired,
+        every entry when none is given, keeping them around to be revalidated"""
+
+        with self._lock:
+            for key, entry in self._entries.items():
+                if not prefixes or key.startswith(prefixes):
+                    entry.expires = 0
+
+    def stats(self):
+
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "evictions": self.evictions
+            }
+
+
+class PersistentLRUCache(LRUCache):
+    """LRUCache whose entries are also written to a table of a DataStore, so they outlive
+    a restart. Each set writes a single row and each eviction deletes one, the most
+    recent fresh rows are loaded back and the rest purged. The values have to be JSON serializable"""
+
+    def __init__(self, store, name, maxsize=512):
+        super().__init__(maxsize)
+        self.store = store
+        self.table = Table(name, [('key', 'text'), ('value', 'json')], ttl=True)
+        self.load()
+
+    def load(self):
+
+        self.store.purge_expired(self.table)
+        rows = self.store.query(self.table, order_by='expires DESC')
+        self.store.delete_keys(self.table, [row['key'] for row in rows[self.maxsize:]])
+        with self._lock:
+            for row in reversed(rows[:self.maxsize]):
+                self._entries[row['key']] = CacheEntry(row['value'], row['expires'])
+
+    def set(self, key, value, ttl, etag=None, last_modified=None):
+
+        entry = super().set(key, value, ttl, etag, last_modified)
+        self.store.put(self.table, {'key': key, 'value': value, 'expires': entry.expires})
+        return entry
+
+    def evicted(self, keys):
+
+        self.store.delete_keys(self.table, keys)
+
+
+class CachedSession(object):
+    """Caches the decoded JSON responses of a requests.Session.
+    Each url gets the TTL of the first pattern it matches, once expired the
+    entry is revalidated with If-None-Match / If-Modified-Since so an unchanged
+    resource costs a 304 instead of a download and a parse.
+    When a scheduler is given every request goes through it to be rate limited and retried.
+    Concurrent requests of the same url share a single request in flight.
+    session is a requests.Session, or a function creating it on the first request,
+    name names its requests in the single flight stats"""
+
+    def __init__(self, session, ttls=(), default_ttl=60, maxsize=512, scheduler=None, name='requests'):
+        self._session = session
+        self._session_lock = threading.Lock()
+        self.scheduler = scheduler
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.default_ttl = default_ttl
+        self.cache = LRUCache(maxsize)
+        self.in_flight = Group(name)
+
+    @property
+    def session(self):
+
+        if callable(self._session):
+            with self._session_lock:
+                if callable(self._session):
+                    self._session = self._session()
+        return self._session
+
+    def get_ttl(self, url):
+
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def get_json(self, url, params=None, raise_errors=True, fields=None, stream=False, parse=None):
+        """Returns the decoded body of a GET request, from the cache when possible.
+        With fields only those fields of each item are decoded and cached, or the records
+        parse builds from each item, a top level array is parsed while it's downloaded
+        when stream is set.
+        Error responses are never cached, they are raised or decoded as they are"""
+
+        key = url if not params else url + "?" + urlencode(sorted(params.items()))
+        if fields:
+            key += "#" + ",".join(fields)
+
+        entry = self.cache.get_entry(key)
+        if entry is not None and entry.is_fresh():
+            self.cache.count(hits=1)
+            return entry.value
+
+        return self.in_flight.do(
+            (key, parse, raise_errors), self.fetch_json, key, entry, url, params, raise_errors, fields, stream, parse
+        )
+
+    def fetch_json(self, key, entry, url, params, raise_errors, fields, stream, parse):
+        """Requests a url missing from the cache, or revalidates its expired entry,
+        and caches its decoded body"""
+
+        ttl = self.get_ttl(url)
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        def send():
+            return self.session.get(url, params=params, headers=headers, stream=stream)
+
+        response = self.scheduler.request(send, url) if self.scheduler else send()
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self.cache.count(revalidated=1)
+            self.cache.set(key, entry.value, ttl, entry.etag, entry.last_modified)
+            return entry.value
+
+        self.cache.count(misses=1)
+
+        if not response.ok:
+            if raise_errors:
+                response.raise_for_status()
+            # Only JSON error bodies, like Octopus ErrorMessage, are handed back
+            try:
+                return decode_response(response)
+            except ValueError:
+                response.raise_for_status()
+
+        value = decode_response(response, fields, stream, parse)
+        if ttl > 0:
+            self.cache.set(
+                key, value, ttl,
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified')
+            )
+        return value
+
+    def invalidate(self, url=None):
+        """Drops a url from the cache, with every params and fields it was requested with,
+        or everything when no url is given"""
+
+        if url is None:
+            self.cache.clear()
+        else:
+            # The keys are the url followed by ?params and #fields, see get_json
+            self.cache.pop(url)
+            self.cache.clear(url + "?", url + "#")
+
+    def expire(self, *prefixes):
+        """Forces the cached urls starting with one of the prefixes, or every cached url,
+        to be revalidated on their next request"""
+
+        self.cache.expire(*prefixes)
+
+    def stats(self):
+
+        stats = self.cache.stats()
+        stats["merged"] = self.in_flight.merged
+        return stats
@@ -0,0 +1,200 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# File of the store shared by the plugins, under BOT_DATA_DIR
+DATASTORE_FILE = 'bot.db'
+
+# Column types of the tables, json columns are kept as TEXT and decoded when read
+COLUMN_TYPES = {'text': 'TEXT', 'integer': 'INTEGER', 'real': 'REAL', 'json': 'TEXT'}
+
+# Stores opened so far, by path
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class Table(object):
+    """Definition of a table: its (name, type) columns, the first one being the primary key,
+    the columns to index, and with ttl an indexed expires column. Rows are read and
+    written as dicts, and the expired ones are skipped and purged"""
+
+    def __init__(self, name, columns, indexes=(), ttl=False):
+        self.name = name
+        self.columns = list(columns) + ([('expires', 'real')] if ttl else [])
+        self.key = self.columns[0][0]
+        self.indexes = list(indexes) + (['expires'] if ttl else [])
+        self.ttl = ttl
+        self.json_columns = set(column for column, column_type in self.columns if column_type == 'json')
+
+    def create_statements(self):
+
+        columns = ", ".join(
+            "{} {}{}".format(column, COLUMN_TYPES[column_type], " PRIMARY KEY" if column == self.key else "")
+            for column, column_type in self.columns
+        )
+        yield "CREATE TABLE IF NOT EXISTS {} ({})".format(self.name, columns)
+        for column in self.indexes:
+            yield "CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})".format(self.name, column)
+
+    def encode(self, row):
+
+        return tuple(
+            json.dumps(row.get(column), separators=(',', ':')) if column in self.json_columns else row.get(column)
+            for column, _ in self.columns
+        )
+
+    def decode(self, row):
+
+        return {
+            column: json.loads(row[column]) if column in self.json_columns and row[column] is not None else row[column]
+            for column, _ in self.columns
+        }
+
+
+class DataStore(object):
+    """Tables of the plugins in a single SQLite database in WAL mode, so reads
+    never wait for a write. Each thread gets its own connection, the writes go
+    one at a time and the rows of put_many, or of a transaction, in a single commit.
+    A table is created the first time it's used"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tables = set()
+        self.writes = 0
+        self.commits = 0
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+
+    def connection(self):
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.depth = 0
+        return connection
+
+    def define(self, table):
+        """Creates the table and its indexes if they don't exist yet"""
+
+        if table.name in self.tables:
+            return
+        with self.transaction() as connection:
+            for statement in table.create_statements():
+                connection.execute(statement)
+        self.tables.add(table.name)
+
+    @contextmanager
+    def transaction(self):
+        """Groups the writes made inside into a single commit, nested transactions join the outer one"""
+
+        connection = self.connection()
+        with self._write_lock:
+            if self._local.depth:
+                self._local.depth += 1
+                try:
+                    yield connection
+                finally:
+                    self._local.depth -= 1
+                return
+
+            self._local.depth = 1
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                connection.execute("COMMIT")
+                self.commits += 1
+            except BaseException:
+                connection.execute("ROLLBACK")
+                # Tables created in the transaction are gone too
+                self.tables.clear()
+                raise
+            finally:
+                self._local.depth = 0
+
+    def put_many(self, table, rows, ttl=None):
+        """Inserts or replaces rows by their key, with ttl they expire in ttl seconds"""
+
+        self.define(table)
+        if ttl is not None:
+            expires = time.time() + ttl
+            rows = [dict(row, expires=expires) for row in rows]
+
+        values = [table.encode(row) for row in rows]
+        if not values:
+            return
+        with self.transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO {} VALUES ({})".format(table.name, ", ".join("?" * len(table.columns))),
+                values
+            )
+            self.writes += len(values)
+
+    def put(self, table, row, ttl=None):
+
+        self.put_many(table, [row], ttl)
+
+    def query(self, table, where=None, params=(), order_by=None, limit=None):
+        """Returns the rows matching an SQL where clause, the expired ones left out"""
+
+        self.define(table)
+        clauses = [where] if where else []
+        if table.ttl:
+            clauses.append("expires > ?")
+            params = tuple(params) + (time.time(),)
+
+        sql = "SELECT * FROM {}".format(table.name)
+        if clauses:
+            sql += " WHERE " + " AND ".join("({})".format(clause) for clause in clauses)
+        if order_by:
+            sql += " ORDER BY " + order_by
+        if limit is not None:
+            sql += " LIMIT {:d}".format(limit)
+
+        return [table.decode(row) for row in self.connection().execute(sql, params)]
+
+    def get(self, table, key):
+        """Returns the row with the given key, None if there's none or it expired"""
+
+        rows = self.query(table, "{} = ?".format(table.key), (key,))
+        return rows[0] if rows else None
+
+    def delete_keys(self, table, keys):
+        """Deletes the rows with the given keys"""
+
+        self.define(table)
+        keys = [(key,) for key in keys]
+        if not keys:
+            return
+        with self.transaction() as connection:
+            connection.executemany("DELETE FROM {} WHERE {} = ?".format(table.name, table.key), keys)
+            self.writes += len(keys)
+
+    def purge_expired(self, table):
+        """Deletes the expired rows of a table, returning how many"""
+
+        self.define(table)
+        with self.transaction() as connection:
+            deleted = connection.execute("DELETE FROM {} WHERE expires <= ?".format(table.name), (time.time(),)).rowcount
+        return deleted
+
+    def stats(self):
+
+        return {'path': self.path, 'tables': len(self.tables), 'writes': self.writes, 'commits': self.commits}
+
+
+def open_store(data_dir):
+    """Returns the store of the bot under data_dir, usually BOT_DATA_DIR, shared by every plugin"""
+
+    path = os.path.join(data_dir, DATASTORE_FILE)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = DataStore(path)
+        return _stores[path]
@@ -0,0 +1,143 @@
+import functools
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# Pools of the pooled commands, by name
+_pools = {}
+_pools_lock = threading.Lock()
+
+BUSY_MESSAGE = "I'm busy with a few of those already, please try again in a minute.."
+
+
+class CommandPool(object):
+    """Bounded worker pool for a command. At most max_concurrency run at once and
+    max_queue more wait for a worker, anything past that is turned away"""
+
+    def __init__(self, name, max_concurrency=2, max_queue=4):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+
+    def submit(self, function, *args):
+        """Queues function(*args), returning its Future or None when the pool is full"""
+
+        with self._lock:
+            if self.running + self.queued >= self.max_concurrency + self.max_queue:
+                self._counters['rejected'] += 1
+                return None
+            self.queued += 1
+
+        return self._executor.submit(self._run, time.monotonic(), function, args)
+
+    def _run(self, submitted_at, function, args):
+
+        started_at = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.count('wait', started_at - submitted_at)
+
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.count('run', time.monotonic() - started_at)
+
+    def count(self, timer, seconds):
+
+        self._counters[timer + 's'] += 1
+        self._counters[timer + '_total'] += seconds
+        self._counters[timer + '_max'] = max(self._counters[timer + '_max'], seconds)
+
+    def stats(self):
+        """Returns the occupation of the pool and its queue wait and run times"""
+
+        with self._lock:
+            counters = dict(self._counters)
+            return {
+                'running': self.running,
+                'queued': self.queued,
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'completed': int(counters.get('runs', 0)),
+                'rejected': int(counters.get('rejected', 0)),
+                'avg_wait': counters.get('wait_total', 0) / counters['waits'] if counters.get('waits') else 0,
+                'max_wait': counters.get('wait_max', 0),
+                'avg_run': counters.get('run_total', 0) / counters['runs'] if counters.get('runs') else 0,
+                'max_run': counters.get('run_max', 0)
+            }
+
+
+def get_pool(name, max_concurrency=2, max_queue=4):
+    """Returns the pool of a name, it's created with the given limits on first use.
+    The limits can be overridden with <NAME>_MAX_CONCURRENCY and <NAME>_MAX_QUEUE"""
+
+    with _pools_lock:
+        if name not in _pools:
+            prefix = name.upper().replace('-', '_')
+            _pools[name] = CommandPool(
+                name,
+                int(os.environ.get(prefix + '_MAX_CONCURRENCY', max_concurrency)),
+                int(os.environ.get(prefix + '_MAX_QUEUE', max_queue))
+            )
+        return _pools[name]
+
+
+def pool_stats():
+    """Returns the stats of every pool, by name"""
+
+    with _pools_lock:
+        pools = dict(_pools)
+    return {name: pool.stats() for name, pool in pools.items()}
+
+
+def send_reply(plugin, msg, text):
+    """Replies to msg outside of the command, where it was asked"""
+
+    to = msg.to if msg.is_group else msg.frm
+    plugin.send(to, text, in_reply_to=msg)
+
+
+def pooled(name, max_concurrency=2, max_queue=4, busy_message=BUSY_MESSAGE):
+    """Runs a command on the worker pool of name instead of the errbot command thread.
+    The replies the command returns or yields are sent as they come, and a command
+    arriving when the pool and its queue are full gets the busy message instead.
+    The undecorated command stays available as __wrapped__"""
+
+    def decorate(command):
+
+        def run(plugin, msg, args):
+            try:
+                replies = command(plugin, msg, args)
+                if replies is None:
+                    return
+                if isinstance(replies, str):
+                    replies = [replies]
+                for reply in replies:
+                    if reply:
+                        send_reply(plugin, msg, reply)
+            except Exception as error:
+                log.exception("Command %s failed", command.__name__)
+                send_reply(plugin, msg, "Computer says nooo. See logs for details:\n{}".format(error))
+
+        @functools.wraps(command)
+        def wrapper(plugin, msg, args):
+            if get_pool(name, max_concurrency, max_queue).submit(run, plugin, msg, args) is None:
+                return busy_message
+            return None
+
+        return wrapper
+
+    return decorate
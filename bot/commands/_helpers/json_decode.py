@@ -0,0 +1,60 @@
+import json
+
+# ijson parses a response while it's downloaded, so a big array is never held
+# whole in memory, orjson is a faster drop in for json.loads. Both are optional
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+def select(item, fields):
+    """Copies only the given fields of a JSON object, dotted fields like Links.Usage keep their nesting"""
+
+    result = {}
+    for field in fields:
+        head, _, rest = field.partition('.')
+        if head not in item:
+            continue
+        if rest:
+            if isinstance(item[head], dict):
+                result.setdefault(head, {}).update(select(item[head], (rest,)))
+        else:
+            result[head] = item[head]
+    return result
+
+
+def select_fields(data, fields, parse=None):
+    """Keeps only the given fields of each item of an array or of a collection page, or of a single object.
+    When parse is given each item is turned into a record by it instead"""
+
+    convert = parse or (lambda item: select(item, fields))
+
+    if isinstance(data, list):
+        return [convert(item) for item in data]
+    if isinstance(data, dict) and isinstance(data.get('Items'), list):
+        return dict(data, Items=[convert(item) for item in data['Items']])
+    return convert(data)
+
+
+def decode_response(response, fields=None, stream=False, parse=None):
+    """Decodes a JSON response keeping only the given fields, or the records built by parse.
+    A streamed top level array is parsed item by item, so only the selected fields
+    of each item are ever kept, otherwise the whole body is parsed and then trimmed"""
+
+    if stream and (fields or parse) and ijson is not None:
+        convert = parse or (lambda item: select(item, fields))
+        response.raw.decode_content = True
+        try:
+            return [convert(item) for item in ijson.items(response.raw, 'item', use_float=True)]
+        finally:
+            response.close()
+
+    data = loads(response.content)
+    return select_fields(data, fields, parse) if fields or parse else data
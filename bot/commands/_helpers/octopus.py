@@ -1,16 +1,110 @@
-import json
+import logging
 import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
 
 import requests
+from requests.adapters import HTTPAdapter
+
+import ssm_parameters
+
+from commands._helpers import warm_cache
+from commands._helpers.cache import CachedSession
+from commands._helpers.project_index import ProjectIndex
+from commands._helpers.records import StepTemplate, TemplateUsage, Project, Release, Phase, ReleaseStatus
+from commands._helpers.request_scheduler import RequestScheduler
+
+
+OCTOPUS_API_URL = os.environ.get('OCTOPUS_API_URL', "https://octopus.com")
+
+log = logging.getLogger(__name__)
+
+# Number of parallel requests used by the fan-out helpers, the connection
+# pool of the shared session is sized to match so workers never wait on a socket
+OCTOPUS_MAX_WORKERS = int(os.environ.get('OCTOPUS_MAX_WORKERS', 16))
+
+def octopus_api_key(request):
+    """Signs each request with the current API key, so a rotated key is picked up without a restart"""
+
+    request.headers['X-Octopus-ApiKey'] = ssm_parameters.get('OCTOPUS_API_KEY')
+    return request
+
+def create_session():
+    """Builds the shared session, it's only done on the first request to Octopus"""
+
+    session = requests.Session()
+    session.auth = octopus_api_key
+    session.headers.update({
+        'Accept': 'application/json'
+    })
+    session.mount('https://', HTTPAdapter(pool_maxsize=OCTOPUS_MAX_WORKERS))
+    session.mount('http://', HTTPAdapter(pool_maxsize=OCTOPUS_MAX_WORKERS))
+    return session
+
+# Seconds each kind of response is served from the cache before it's revalidated
+OCTOPUS_CACHE_TTLS = [
+    (r'/actiontemplates/All$', 300),
+    (r'/actiontemplates/[^/]+/usage$', 300),
+    (r'/projectgroups/[^/]+/projects$', 900),
+    (r'/projects/[^/]+/releases$', 60),
+    (r'/releases/[^/]+/progression$', 30),
+    (r'/projects/all$', 300),
+    (r'/projects/[^/]+$', 3600)
+]
+OCTOPUS_CACHE_SIZE = int(os.environ.get('OCTOPUS_CACHE_SIZE', 2048))
+
+# Urls of the resources each report is built from, a fresh report only revalidates its own
+STEP_TEMPLATES_URL = OCTOPUS_API_URL + "/api/Spaces-1/actiontemplates"
+PROJECT_INDEX_URLS = (OCTOPUS_API_URL + "/api/projects/all",)
+RELEASE_STATUS_URLS = (
+    OCTOPUS_API_URL + "/api/projectgroups/",
+    OCTOPUS_API_URL + "/api/projects/",
+    OCTOPUS_API_URL + "/api/releases/"
+)
+
+# Items requested per page when walking a paginated collection
+OCTOPUS_PAGE_SIZE = int(os.environ.get('OCTOPUS_PAGE_SIZE', 30))
+
+# Requests per second allowed to Octopus, retries of throttled and failed requests back off
+# exponentially and the concurrency shrinks when Octopus answers slower than the latency target
+OCTOPUS_RATE_LIMIT = float(os.environ.get('OCTOPUS_RATE_LIMIT', 100))
+OCTOPUS_MAX_RETRIES = int(os.environ.get('OCTOPUS_MAX_RETRIES', 4))
+OCTOPUS_LATENCY_TARGET = float(os.environ.get('OCTOPUS_LATENCY_TARGET', 1.0))
+
+request_scheduler = RequestScheduler(
+    rate=OCTOPUS_RATE_LIMIT,
+    burst=OCTOPUS_RATE_LIMIT * 2,
+    max_concurrency=OCTOPUS_MAX_WORKERS,
+    latency_target=OCTOPUS_LATENCY_TARGET,
+    max_retries=OCTOPUS_MAX_RETRIES,
+    retry_exceptions=(requests.ConnectionError, requests.Timeout)
+)
+
+cached_session = CachedSession(
+    create_session,
+    ttls=OCTOPUS_CACHE_TTLS,
+    maxsize=OCTOPUS_CACHE_SIZE,
+    scheduler=request_scheduler,
+    name='octopus_requests'
+)
+
+# Seconds between the scheduled reloads of the project index and the release statuses
+PROJECT_INDEX_REFRESH = int(os.environ.get('PROJECT_INDEX_REFRESH', 900))
+RELEASE_STATUS_REFRESH = int(os.environ.get('RELEASE_STATUS_REFRESH', 300))
+
+# Fields of each Octopus resource the helpers use, nothing else is kept after decoding
+TEMPLATE_FIELDS = ('Id', 'Name', 'Version', 'CommunityActionTemplateId', 'Links.Usage')
+USAGE_FIELDS = ('ProjectId', 'ProjectName', 'Version')
+PROJECT_FIELDS = ('Id', 'Name', 'Slug', 'ProjectGroupId')
+RELEASE_FIELDS = ('Id', 'Version', 'Assembled', 'ProjectId')
+PROGRESSION_FIELDS = ('Phases',)
+
+
+class OctopusError(Exception):
+    """Raised when the Octopus API answers with an ErrorMessage"""
 
 
-OCTOPUS_API_URL = "https://octopus.com"
-session = requests.Session()
-session.headers.update({
-    'X-Octopus-ApiKey': os.environ['OCTOPUS_API_KEY'],
-    'Accept': 'application/json'
-})
-
 PROJECT_GROUPS = {
     '63': 'Self Service Projects',
     '241': 'Project - API',
@@ -19,17 +113,104 @@ PROJECT_GROUPS = {
 }
 
 def get_step_template_list():
+    """Retrieves every step template of the space as StepTemplate records"""
+
+    get_url = STEP_TEMPLATES_URL + "/All"
+    template_list = cached_session.get_json(
+        get_url, raise_errors=False, fields=TEMPLATE_FIELDS, stream=True, parse=StepTemplate.from_api
+    )
 
-    get_url = OCTOPUS_API_URL + "/api/Spaces-1/actiontemplates/All"
-    get_return = session.get(get_url).content
-    return json.loads(get_return)
+    if isinstance(template_list, dict) and 'ErrorMessage' in template_list:
+        raise OctopusError(template_list['ErrorMessage'])
+
+    return template_list
 
 
 def get_template_usage(usage_url):
+    """Retrieves the usage of a step template as TemplateUsage records"""
 
     get_url = OCTOPUS_API_URL + usage_url
-    get_return = session.get(get_url).content
-    return json.loads(get_return)
+    return cached_session.get_json(get_url, fields=USAGE_FIELDS, stream=True, parse=TemplateUsage.from_api)
+
+
+def get_template_usage_list(usage_urls, max_workers=OCTOPUS_MAX_WORKERS, on_result=None):
+    """Retrieves the usage of several step templates in parallel.
+    The results are returned in the same order as the given usage urls,
+    on_result(index, usage) is called as soon as each one arrives"""
+
+    def fetch(index, usage_url):
+        template_usage = get_template_usage(usage_url)
+        if on_result is not None:
+            on_result(index, template_usage)
+        return template_usage
+
+    usage_urls = list(usage_urls)
+    if max_workers <= 1 or len(usage_urls) <= 1:
+        return [fetch(index, usage_url) for index, usage_url in enumerate(usage_urls)]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(usage_urls))) as executor:
+        return list(executor.map(fetch, range(len(usage_urls)), usage_urls))
+
+
+def iter_collection(url, skip=0, take=None, page_size=OCTOPUS_PAGE_SIZE, fields=None, parse=None):
+    """Lazily yields the items of a paginated Octopus collection.
+    Pages are only requested when the previous one is consumed, following the
+    Links.Page.Next of each page, and never more than take items are asked for"""
+
+    params = {"skip": skip, "take": page_size if take is None else min(take, page_size)}
+    remaining = take
+
+    while params["take"] > 0:
+        data = cached_session.get_json(url, params=params, fields=fields, parse=parse)
+
+        for item in data["Items"]:
+            yield item
+
+        if remaining is not None:
+            remaining -= len(data["Items"])
+
+        next_page = data.get("Links", {}).get("Page.Next")
+        if not next_page or not data["Items"] or remaining == 0:
+            return
+
+        path, _, query = next_page.partition("?")
+        url = OCTOPUS_API_URL + path
+        params = dict(parse_qsl(query))
+        params["take"] = int(params.get("take", page_size))
+        if remaining is not None:
+            params["take"] = min(params["take"], remaining)
+
+
+def parse_project(item):
+    """Builds the Project record of an Octopus project, resolving its group name"""
+
+    return Project.from_api(item, PROJECT_GROUPS)
+
+
+def iter_group_projects(project_group_id, skip=0, take=None):
+    """Lazily yields the projects of a single project group"""
+
+    full_project_url = (
+        OCTOPUS_API_URL
+        + "/api/projectgroups"
+        + "/ProjectGroups-"
+        + project_group_id
+        + "/projects"
+    )
+    print("Full Project Url: {}".format(full_project_url))
+
+    for project in iter_collection(full_project_url, skip=skip, take=take, fields=PROJECT_FIELDS, parse=parse_project):
+        print("Project Info: {} - {}".format(project.id, project.name))
+        yield project
+
+
+def iter_projects(project_groups_list=PROJECT_GROUPS):
+    """Lazily yields the projects of a given set of project groups, one page at a time"""
+
+    for key, value in project_groups_list.items():
+        print("Key: {} Value: {}".format(key,value))
+        for project in iter_group_projects(key):
+            yield project
 
 
 def get_projects(project_groups_list=PROJECT_GROUPS):
@@ -41,47 +222,18 @@ def get_projects(project_groups_list=PROJECT_GROUPS):
         project_group = {
             "project_group_id": key,
             "project_group_name": value,
-            "projects": []
+            "projects": list(iter_group_projects(key))
         }
+        print("Item Count: {}".format(len(project_group['projects'])))
 
-        full_project_url = (
-            OCTOPUS_API_URL
-            + "/api/projectgroups"
-            + "/ProjectGroups-"
-            + key
-            + "/projects"
-        )
-        print("Full Project Url: {}".format(full_project_url))
-
-        response = session.get(url=full_project_url)
-
-        if not response.ok:
-            response.raise_for_status()
-
-        data = json.loads(response.content)
-        items = data["Items"]
-        print("Item Count: {}".format(len(items)))
-
-        if len(items) == 0:
-            continue
-
-        for item in items:
-            print("Project Info: {} - {}".format(item['Id'], item['Name']))
-            project_group['projects'].append({
-                "project_id": item["Id"],
-                "project_name": item["Name"],
-                "project_slug": item["Slug"],
-                "project_api_url": full_project_url,
-                "project_url": "https://octopus.com/app#/Spaces-1/projects/{}/overview".format(item["Slug"])
-            })
-
-        result['Items'].append(project_group)
+        if project_group['projects']:
+            result['Items'].append(project_group)
 
     return result
 
 
-def get_latest_release(project_id, project_slug):
-    """Retrieves the latest release for a given project"""
+def iter_releases(project_id, skip=0, take=None):
+    """Lazily yields the releases of a given project, newest first"""
 
     full_release_url = (
         OCTOPUS_API_URL
@@ -89,26 +241,20 @@ def get_latest_release(project_id, project_slug):
         + "/{}".format(project_id)
         + "/releases"
     )
-    print("Full Release Url: {}".format(full_release_url))
 
-    release_response = session.get(url=full_release_url)
+    return iter_collection(full_release_url, skip=skip, take=take, fields=RELEASE_FIELDS, parse=Release.from_api)
+
 
-    if not release_response.ok:
-        release_response.raise_for_status()
+def get_latest_release(project_id):
+    """Retrieves the latest release for a given project, None when it has no releases"""
 
-    data = json.loads(release_response.content)
-    items = data["Items"]
+    return next(iter_releases(project_id, take=1), None)
 
-    if len(items) == 0:
-        return {}
 
-    return {
-        "release_id": items[0]["Id"],
-        "assembled": items[0]["Assembled"],
-        "version": items[0]["Version"],
-        "release_api_url": full_release_url,
-        "release_url": "https://octopus.com/app#/Spaces-1/projects/{}/releases/{}".format(project_slug, items[0]["Version"])
-    }
+def parse_progression(data):
+    """Builds the Phase records of an Octopus release progression"""
+
+    return [Phase.from_api(phase) for phase in data["Phases"]]
 
 
 def get_release_progression(release):
@@ -117,56 +263,135 @@ def get_release_progression(release):
     full_progression_url = (
         OCTOPUS_API_URL
         + "/api/releases"
-        + "/{}".format(release["release_id"])
+        + "/{}".format(release.id)
         + "/progression"
     )
 
-    progression_response = session.get(url=full_progression_url)
+    return cached_session.get_json(full_progression_url, fields=PROGRESSION_FIELDS, parse=parse_progression)
 
-    if not progression_response.ok:
-        progression_response.raise_for_status()
 
-    data = json.loads(progression_response.content)
-    phases = data["Phases"]
+def get_release_statuses(project_groups_list=PROJECT_GROUPS, max_workers=OCTOPUS_MAX_WORKERS):
+    """Retrieves the latest release and its progression for every project of the given groups.
+    The requests are pipelined on one pool: the release of a project is requested as soon
+    as its page of projects arrives, and the progression as soon as the release arrives.
+    A project whose requests fail gets a status with the error, the others are still retrieved"""
 
-    if len(phases) == 0:
-        return []
+    statuses = []
+    jobs = queue.Queue()
 
-    release_progression = []
-    for phase in phases:
-        release_progression.append({
-            "phase_name": phase["Name"],
-            "progress": phase["Progress"]
-        })
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
 
-    return release_progression
+        def submit(function, *args):
+            jobs.put(executor.submit(function, *args))
 
+        def failed(project, release, error):
+            log.warning("Failed to retrieve the release status of %s: %s", project.name, error)
+            statuses.append(ReleaseStatus(project, release, (), str(error)))
+
+        def fetch_progression(project, release):
+            try:
+                phases = tuple(get_release_progression(release))
+            except Exception as error:
+                failed(project, release, error)
+            else:
+                statuses.append(ReleaseStatus(project, release, phases))
+
+        def fetch_release(project):
+            try:
+                release = get_latest_release(project.id)
+            except Exception as error:
+                failed(project, None, error)
+                return
+
+            if release is None:
+                statuses.append(ReleaseStatus(project, None, ()))
+            else:
+                submit(fetch_progression, project, release)
+
+        def fetch_group(key):
+            for project in iter_group_projects(key):
+                submit(fetch_release, project)
+
+        for key in project_groups_list:
+            submit(fetch_group, key)
+
+        # A job always queues its follow-ups before it finishes, so the
+        # pipeline is done once the queue is drained
+        while not jobs.empty():
+            jobs.get().result()
+
+    group_order = list(project_groups_list)
+    statuses.sort(key=lambda status: (group_order.index(status.project.group_id), status.project.name.lower()))
+
+    return statuses
+
+
+def get_all_projects():
+    """Retrieves every project of the space in a single request"""
+
+    full_project_url = OCTOPUS_API_URL + "/api/projects/all"
+    return cached_session.get_json(full_project_url, fields=PROJECT_FIELDS, stream=True, parse=parse_project)
 
-def get_project_slug(project_id):
-    """Retrieves the Slug for the given project id"""
 
-    url = "https://octopus.com/api/projects/{}".format(project_id)
+project_index = ProjectIndex(get_all_projects)
 
-    response = session.get(url=url)
 
-    if not response.ok:
-        response.raise_for_status()
+def find_project(project_key):
+    """Retrieves a project by its Id, Slug or Name.
+    The project index answers without any request, the API is only used on a miss"""
 
-    data = json.loads(response.content)
+    project = project_index.get(project_key)
+    if project is not None:
+        return project
 
-    return data["Slug"]
+    url = OCTOPUS_API_URL + "/api/projects/{}".format(project_key)
+
+    project = cached_session.get_json(url, fields=PROJECT_FIELDS, parse=parse_project)
+    project_index.add(project)
+
+    return project
+
+
+def get_project_slug(project_id):
+    """Retrieves the Slug for the given project id"""
+
+    return find_project(project_id).slug
 
 
 def get_project_id(project_slug):
     """Retrieves the ID for the given project slug"""
 
-    url = "https://octopus.com/api/projects/{}".format(project_slug)
+    return find_project(project_slug).id
+
+
+def cache_stats():
+    """Returns the hit/miss counters of the Octopus response cache"""
+
+    return cached_session.stats()
+
+
+def scheduler_stats():
+    """Returns the per endpoint request, retry and throttling counters"""
+
+    return request_scheduler.stats()
+
+
+def refresh_project_index(fresh=False):
+    """Reloads the project index, returning how many projects it has"""
+
+    if fresh:
+        cached_session.expire(*PROJECT_INDEX_URLS)
+    project_index.load()
+    return len(project_index)
+
 
-    response = session.get(url=url)
+def refresh_release_statuses(fresh=False):
+    """Retrieves the release statuses, revalidating their cached responses when fresh"""
 
-    if not response.ok:
-        response.raise_for_status()
+    if fresh:
+        cached_session.expire(*RELEASE_STATUS_URLS)
+    return get_release_statuses()
 
-    data = json.loads(response.content)
 
-    return data["Id"]
+warm_cache.register('project_index', refresh_project_index, PROJECT_INDEX_REFRESH)
+warm_cache.register('release_statuses', refresh_release_statuses, RELEASE_STATUS_REFRESH)
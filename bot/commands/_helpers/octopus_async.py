@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import os
+import threading
+from urllib.parse import parse_qsl
+
+import aiohttp
+
+import ssm_parameters
+
+from commands._helpers import octopus
+from commands._helpers.json_decode import loads, select_fields
+from commands._helpers.octopus import (
+    OCTOPUS_API_URL, OCTOPUS_PAGE_SIZE, PROJECT_GROUPS, OctopusError,
+    TEMPLATE_FIELDS, USAGE_FIELDS, PROJECT_FIELDS, RELEASE_FIELDS, PROGRESSION_FIELDS,
+    parse_project, parse_progression
+)
+from commands._helpers.records import StepTemplate, TemplateUsage, Release, ReleaseStatus
+
+log = logging.getLogger(__name__)
+
+# Requests in flight at once, the keep-alive connection pool is sized to match
+OCTOPUS_MAX_CONCURRENCY = int(os.environ.get('OCTOPUS_MAX_CONCURRENCY', 32))
+
+# Seconds an idle connection is kept open for the next request
+OCTOPUS_KEEPALIVE_TIMEOUT = int(os.environ.get('OCTOPUS_KEEPALIVE_TIMEOUT', 30))
+
+
+class AsyncOctopusClient(object):
+    """asyncio version of the octopus helpers over a pooled keep-alive aiohttp session.
+    The session is created on first use, on the event loop the client is used from"""
+
+    def __init__(self, api_url=OCTOPUS_API_URL, api_key=None, max_concurrency=OCTOPUS_MAX_CONCURRENCY):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _get_session(self):
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                keepalive_timeout=OCTOPUS_KEEPALIVE_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    'X-Octopus-ApiKey': self.api_key or ssm_parameters.get('OCTOPUS_API_KEY'),
+                    'Accept': 'application/json'
+                }
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self):
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_json(self, url, params=None, raise_errors=True, fields=None, parse=None):
+        """Returns the decoded body of a GET request keeping only the given fields,
+        or the records built by parse, at most max_concurrency run at once"""
+
+        session = self._get_session()
+        async with self._semaphore:
+            async with session.get(url, params=params) as response:
+                if raise_errors:
+                    response.raise_for_status()
+                data = loads(await response.read())
+
+        if (fields or parse) and response.status < 400:
+            return select_fields(data, fields, parse)
+        return data
+
+    async def get_step_template_list(self):
+
+        get_url = self.api_url + "/api/Spaces-1/actiontemplates/All"
+        template_list = await self.get_json(get_url, raise_errors=False, fields=TEMPLATE_FIELDS)
+
+        if isinstance(template_list, dict) and 'ErrorMessage' in template_list:
+            raise OctopusError(template_list['ErrorMessage'])
+
+        return [StepTemplate.from_api(item) for item in template_list]
+
+    async def get_template_usage(self, usage_url):
+
+        get_url = self.api_url + usage_url
+        return await self.get_json(get_url, fields=USAGE_FIELDS, parse=TemplateUsage.from_api)
+
+    async def get_template_usage_list(self, usage_urls):
+        """Retrieves the usage of several step templates concurrently, in the given order"""
+
+        return await asyncio.gather(*(self.get_template_usage(usage_url) for usage_url in usage_urls))
+
+    async def iter_collection(self, url, skip=0, take=None, page_size=OCTOPUS_PAGE_SIZE, fields=None, parse=None):
+        """Lazily yields the items of a paginated Octopus collection following Links.Page.Next"""
+
+        params = {"skip": skip, "take": page_size if take is None else min(take, page_size)}
+        remaining = take
+
+        while params["take"] > 0:
+            data = await self.get_json(url, params=params, fields=fields, parse=parse)
+
+            for item in data["Items"]:
+                yield item
+
+            if remaining is not None:
+                remaining -= len(data["Items"])
+
+            next_page = data.get("Links", {}).get("Page.Next")
+            if not next_page or not data["Items"] or remaining == 0:
+                return
+
+            path, _, query = next_page.partition("?")
+            url = self.api_url + path
+            params = dict(parse_qsl(query))
+            params["take"] = int(params.get("take", page_size))
+            if remaining is not None:
+                params["take"] = min(params["take"], remaining)
+
+    async def get_group_projects(self, project_group_id):
+
+        full_project_url = (
+            self.api_url
+            + "/api/projectgroups"
+            + "/ProjectGroups-"
+            + project_group_id
+            + "/projects"
+        )
+
+        return [
+            project
+            async for project in self.iter_collection(full_project_url, fields=PROJECT_FIELDS, parse=parse_project)
+        ]
+
+    async def get_projects(self, project_groups_list=PROJECT_GROUPS):
+        """Retrieves a JSON collection of projects for a given set of project groups"""
+
+        groups = await asyncio.gather(*(
+            self.get_group_projects(key) for key in project_groups_list
+        ))
+
+        result = { "Items": [] }
+        for (key, value), projects in zip(project_groups_list.items(), groups):
+            if projects:
+                result['Items'].append({
+                    "project_group_id": key,
+                    "project_group_name": value,
+                    "projects": projects
+                })
+
+        return result
+
+    async def get_latest_release(self, project_id):
+
+        full_release_url = self.api_url + "/api/projects/{}/releases".format(project_id)
+
+        releases = self.iter_collection(full_release_url, take=1, fields=RELEASE_FIELDS, parse=Release.from_api)
+        try:
+            async for release in releases:
+                return release
+        finally:
+            # Closed right away instead of whenever the generator is collected
+            await releases.aclose()
+
+        return None
+
+    async def get_release_progression(self, release):
+
+        full_progression_url = self.api_url + "/api/releases/{}/progression".format(release.id)
+        return await self.get_json(full_progression_url, fields=PROGRESSION_FIELDS, parse=parse_progression)
+
+    async def get_release_status(self, project):
+        """Retrieves the latest release of a project and its progression,
+        a failed request gives a status with the error"""
+
+        release = None
+        try:
+            release = await self.get_latest_release(project.id)
+            phases = await self.get_release_progression(release) if release is not None else ()
+        except Exception as error:
+            log.warning("Failed to retrieve the release status of %s: %s", project.name, error)
+            return ReleaseStatus(project, release, (), str(error))
+
+        return ReleaseStatus(project, release, tuple(phases))
+
+    async def get_release_statuses(self, project_groups_list=PROJECT_GROUPS):
+        """Retrieves the latest release and its progression for every project of the given groups,
+        each project starts its requests as soon as its page of projects arrives"""
+
+        tasks = []
+        for key in project_groups_list:
+            full_project_url = self.api_url + "/api/projectgroups/ProjectGroups-{}/projects".format(key)
+            async for project in self.iter_collection(full_project_url, fields=PROJECT_FIELDS, parse=parse_project):
+                tasks.append(asyncio.ensure_future(self.get_release_status(project)))
+
+        statuses = list(await asyncio.gather(*tasks))
+
+        group_order = list(project_groups_list)
+        statuses.sort(key=lambda status: (group_order.index(status.project.group_id), status.project.name.lower()))
+
+        return statuses
+
+    async def find_project(self, project_key):
+
+        project = octopus.project_index.get(project_key)
+        if project is not None:
+            return project
+
+        url = self.api_url + "/api/projects/{}".format(project_key)
+        project = await self.get_json(url, fields=PROJECT_FIELDS, parse=parse_project)
+        octopus.project_index.add(project)
+
+        return project
+
+    async def get_project_slug(self, project_id):
+
+        return (await self.find_project(project_id)).slug
+
+    async def get_project_id(self, project_slug):
+
+        return (await self.find_project(project_slug)).id
+
+
+# The sync facade runs every coroutine on one long lived event loop thread,
+# so the pooled connections are reused across the calls of every plugin
+_loop = None
+_loop_lock = threading.Lock()
+client = AsyncOctopusClient()
+
+
+def _get_loop():
+
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="octopus-async", daemon=True).start()
+    return _loop
+
+
+def run(coroutine):
+    """Runs a coroutine of the async client from blocking code and returns its result"""
+
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_loop()).result()
+
+
+def get_step_template_list():
+    return run(client.get_step_template_list())
+
+
+def get_template_usage(usage_url):
+    return run(client.get_template_usage(usage_url))
+
+
+def get_template_usage_list(usage_urls):
+    return run(client.get_template_usage_list(list(usage_urls)))
+
+
+def get_projects(project_groups_list=PROJECT_GROUPS):
+    return run(client.get_projects(project_groups_list))
+
+
+def get_latest_release(project_id):
+    return run(client.get_latest_release(project_id))
+
+
+def get_release_progression(release):
+    return run(client.get_release_progression(release))
+
+
+def get_release_statuses(project_groups_list=PROJECT_GROUPS):
+    return run(client.get_release_statuses(project_groups_list))
+
+
+def get_project_slug(project_id):
+    return run(client.get_project_slug(project_id))
+
+
+def get_project_id(project_slug):
+    return run(client.get_project_id(project_slug))
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+
+from commands._helpers.datastore import Table
+from commands._helpers.records import Project
+
+# The projects of the last load, so a restart can answer lookups before loading again
+PROJECTS_TABLE = Table(
+    'projects',
+    [('id', 'text'), ('name', 'text'), ('slug', 'text'), ('group_id', 'text'), ('group_name', 'text')],
+    indexes=['slug', 'name']
+)
+
+log = logging.getLogger(__name__)
+
+
+class ProjectIndex(object):
+    """In-memory index of the Octopus projects by Id, Slug and Name.
+    The whole index is rebuilt from a single bulk load and swapped in at once,
+    so lookups never see a half built index and never need a lock.
+    With a store the projects are also kept in it, only the ones that changed are written.
+    The swaps and adds are serialized, so each diff is taken against the index it replaces"""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self.store = None
+        self._by_id = {}
+        self._by_slug = {}
+        self._by_name = {}
+        self._swap_lock = threading.Lock()
+        self._thread = None
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def load(self):
+        """Rebuilds the index from the loader, a list of Project records"""
+
+        self._swap(self._loader())
+        self.loaded_at = time.time()
+        log.info("Project index loaded with %s projects", len(self._by_id))
+
+    def restore(self, store):
+        """Rebuilds the index from the projects kept in the store by a previous load"""
+
+        self._swap(Project(**row) for row in store.query(PROJECTS_TABLE))
+        log.info("Project index restored with %s projects", len(self._by_id))
+
+    def _swap(self, projects):
+
+        by_id, by_slug, by_name = {}, {}, {}
+        for project in projects:
+            self._index(project, by_id, by_slug, by_name)
+
+        with self._swap_lock:
+            previous = self._by_id
+            self._by_id, self._by_slug, self._by_name = by_id, by_slug, by_name
+
+            if self.store is not None:
+                with self.store.transaction():
+                    self.store.put_many(PROJECTS_TABLE, [
+                        project._asdict() for project in by_id.values() if previous.get(project.id) != project
+                    ])
+                    self.store.delete_keys(PROJECTS_TABLE, [project_id for project_id in previous if project_id not in by_id])
+
+    def add(self, project):
+        """Adds a single project found outside of a bulk load"""
+
+        with self._swap_lock:
+            self._index(project, self._by_id, self._by_slug, self._by_name)
+            if self.store is not None:
+                self.store.put(PROJECTS_TABLE, project._asdict())
+
+    @staticmethod
+    def _index(project, by_id, by_slug, by_name):
+
+        by_id[project.id] = project
+        by_slug[project.slug.lower()] = project
+        by_name[project.name.lower()] = project
+
+    def get(self, key):
+        """Returns the project with the given Id, Slug or Name, or None if it isn't indexed"""
+
+        return (
+            self._by_id.get(key)
+            or self._by_slug.get(key.lower())
+            or self._by_name.get(key.lower())
+        )
+
+    def start(self, store=None):
+        """Loads the index on a background thread, the scheduler keeps it refreshed afterwards.
+        With a store the index starts from the projects kept in it until the load is done"""
+
+        if self.loaded_at is not None or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        if store is not None and self.store is None:
+            self.restore(store)
+            self.store = store
+
+        self._thread = threading.Thread(target=self._initial_load, name="project-index", daemon=True)
+        self._thread.start()
+
+    def _initial_load(self):
+
+        try:
+            self.load()
+        except Exception:
+            log.exception("Failed to load the project index")
@@ -0,0 +1,92 @@
+from collections import namedtuple
+
+OCTOPUS_APP_URL = "https://octopus.com/app#/Spaces-1/"
+
+# Compact immutable records for the Octopus resources the helpers pass around.
+# They are tuples, so they take a fraction of the memory of the API dicts, they
+# are read by attribute and they serialize to JSON as plain lists
+
+
+class StepTemplate(namedtuple('StepTemplate', 'id name version community_id usage_url')):
+
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, item):
+        return cls(
+            item['Id'],
+            item['Name'],
+            int(item['Version']),
+            item.get('CommunityActionTemplateId'),
+            item['Links']['Usage']
+        )
+
+    @property
+    def url(self):
+        return OCTOPUS_APP_URL + "library/steptemplates/{}/usage".format(self.id)
+
+
+class TemplateUsage(namedtuple('TemplateUsage', 'project_id project_name version')):
+
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, item):
+        return cls(item.get('ProjectId'), item['ProjectName'], int(item['Version']))
+
+
+class Project(namedtuple('Project', 'id name slug group_id group_name')):
+
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, item, project_groups):
+        group_id = item.get('ProjectGroupId', '').replace('ProjectGroups-', '')
+        return cls(item['Id'], item['Name'], item['Slug'], group_id, project_groups.get(group_id))
+
+    @property
+    def url(self):
+        return OCTOPUS_APP_URL + "projects/{}/overview".format(self.slug)
+
+
+class Release(namedtuple('Release', 'id version assembled project_id')):
+
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, item):
+        return cls(item['Id'], item['Version'], item['Assembled'], item.get('ProjectId'))
+
+    def url(self, project_slug):
+        return OCTOPUS_APP_URL + "projects/{}/releases/{}".format(project_slug, self.version)
+
+
+class Phase(namedtuple('Phase', 'name progress')):
+
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, item):
+        return cls(item['Name'], item['Progress'])
+
+
+class ReleaseStatus(namedtuple('ReleaseStatus', 'project release phases error', defaults=(None,))):
+    """The latest release of a project, None when it has none, and its progression.
+    error tells why they couldn't be retrieved, the other projects are still shown"""
+
+    __slots__ = ()
+
+    @property
+    def release_url(self):
+        return self.release.url(self.project.slug)
+
+
+class OutdatedTemplate(namedtuple('OutdatedTemplate', 'template usages')):
+    """A step template and the usages of its older versions"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, row):
+        template, usages = row
+        return cls(StepTemplate(*template), tuple(TemplateUsage(*usage) for usage in usages))
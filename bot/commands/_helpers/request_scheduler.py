@@ -0,0 +1,191 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+log = logging.getLogger(__name__)
+
+# Status codes worth retrying, the server is busy or a proxy in front of it failed
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+# Status codes meaning the server asks us to slow down
+THROTTLED_STATUS = (429, 503)
+
+
+class TokenBucket(object):
+    """Allows rate requests per second on average with bursts of up to capacity"""
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it"""
+
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+
+
+class AdaptiveLimiter(object):
+    """Concurrency limit that grows by 1/limit after each fast response, about one per
+    round trip of a full window, and is cut by a factor when responses get slower
+    than the latency target or are throttled.
+    It's cut at most once per round trip: the slow responses of requests sent before
+    the last cut were already accounted for by it, so they don't cut again"""
+
+    def __init__(self, max_concurrency, min_concurrency=1, latency_target=1.0, backoff_factor=0.7,
+                 clock=time.monotonic):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target = latency_target
+        self.backoff_factor = backoff_factor
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.cuts = 0
+        self._clock = clock
+        self._cut_at = None
+        self._condition = threading.Condition()
+
+    def acquire(self):
+
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, throttled=False):
+
+        with self._condition:
+            self.in_flight -= 1
+            now = self._clock()
+
+            if throttled or latency > self.latency_target:
+                sent_at = now - latency
+                if self._cut_at is None or sent_at >= self._cut_at:
+                    self.limit = max(self.min_concurrency, self.limit * self.backoff_factor)
+                    self._cut_at = now
+                    self.cuts += 1
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1))
+
+            self._condition.notify_all()
+
+
+class RequestScheduler(object):
+    """Runs requests through a token bucket and an adaptive concurrency limit,
+    retrying the retryable ones with jittered exponential backoff"""
+
+    def __init__(self, rate=20, burst=40, max_concurrency=16, min_concurrency=2, latency_target=1.0,
+                 max_retries=4, backoff_base=0.5, backoff_max=30, retry_exceptions=()):
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AdaptiveLimiter(max_concurrency, min_concurrency, latency_target)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_exceptions = tuple(retry_exceptions)
+        self._counters = defaultdict(lambda: defaultdict(int))
+        self._counters_lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(url):
+        """Groups urls by endpoint, replacing the Octopus ids like Projects-12 in the path"""
+
+        return re.sub(r'[A-Za-z]+-\d+', '{id}', urlsplit(url).path)
+
+    def count(self, endpoint, counter, value=1):
+
+        with self._counters_lock:
+            self._counters[endpoint][counter] += value
+
+    def backoff(self, attempt, response=None):
+        """Seconds to wait before the next attempt, the server's Retry-After wins when given"""
+
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                try:
+                    return min(self.backoff_max, max(0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, send, url):
+        """Calls send() to make the request for url and returns its response.
+        A retryable response is retried up to max_retries times, then it's returned as it is"""
+
+        endpoint = self.endpoint(url)
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self.limiter.acquire()
+
+            response = None
+            error = None
+            time_start = time.monotonic()
+            try:
+                response = send()
+            except self.retry_exceptions as exception:
+                error = exception
+            finally:
+                latency = time.monotonic() - time_start
+                throttled = response is not None and response.status_code in THROTTLED_STATUS
+                self.limiter.release(latency, throttled)
+
+            self.count(endpoint, 'requests')
+            self.count(endpoint, 'latency', latency)
+
+            if error is None and response.status_code not in RETRYABLE_STATUS:
+                return response
+
+            if throttled:
+                self.count(endpoint, 'throttled')
+
+            if attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+
+            self.count(endpoint, 'retries')
+            delay = self.backoff(attempt, response)
+            if response is not None:
+                # A streamed response holds its pooled connection until it's closed
+                response.close()
+            log.warning(
+                "Retrying %s in %.1fs after %s",
+                url, delay, error if error is not None else response.status_code
+            )
+            time.sleep(delay)
+
+    def stats(self):
+        """Returns the counters of every endpoint and the current concurrency limit"""
+
+        with self._counters_lock:
+            endpoints = {endpoint: dict(counters) for endpoint, counters in self._counters.items()}
+
+        return {
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "endpoints": endpoints
+        }
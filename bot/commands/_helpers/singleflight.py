@@ -0,0 +1,77 @@
+import copy
+import threading
+
+# Groups created so far, by name, for their stats
+_groups = {}
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Group(object):
+    """Merges concurrent calls with the same key into one.
+    The first caller of a key runs the function, the callers arriving while it
+    runs wait for it and get the same result, or a copy of the same exception
+    raised from it, so threads never raise one exception object together"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.merged = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        _groups[name] = self
+
+    def do(self, key, function, *args, **kwargs):
+        """Returns function(*args, **kwargs), shared with the calls of key already in flight"""
+
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+            else:
+                self.merged += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise _copy_error(call.error) from call.error
+            return call.value
+
+        try:
+            call.value = function(*args, **kwargs)
+            return call.value
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def stats(self):
+        """Returns how many calls were made, how many were merged into one in flight, and the keys in flight"""
+
+        with self._lock:
+            return {'calls': self.calls, 'merged': self.merged, 'in_flight': len(self._in_flight)}
+
+
+def _copy_error(error):
+
+    try:
+        return copy.copy(error).with_traceback(None)
+    except Exception:
+        return RuntimeError("{} failed in the call merged with this one: {!r}".format(type(error).__name__, error))
+
+
+def stats():
+    """Returns the stats of every group, by name"""
+
+    return {name: group.stats() for name, group in list(_groups.items())}
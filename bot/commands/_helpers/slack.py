@@ -1,32 +1,457 @@
-from slackclient import SlackClient
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
 import re
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import Future
+
+import ssm_parameters
+from commands._helpers.request_scheduler import TokenBucket
+
+SLACK_API_URL = os.environ.get('SLACK_API_URL', "https://slack.com/api/")
+
+# Connections kept open to Slack for each token, shared by every plugin thread
+SLACK_POOL_SIZE = int(os.environ.get('SLACK_POOL_SIZE', 8))
+
+# Seconds to wait for Slack to answer a call
+SLACK_TIMEOUT = float(os.environ.get('SLACK_TIMEOUT', 10))
+
+# Calls per second allowed by each Slack rate limit tier, see https://api.slack.com/docs/rate-limits
+# chat.postMessage has its own limit of about one message per second for each channel
+SLACK_TIER_RATES = {
+    1: 1 / 60.0,
+    2: 20 / 60.0,
+    3: 50 / 60.0,
+    4: 100 / 60.0,
+    'special': 1.0
+}
+SLACK_METHOD_TIERS = {
+    'chat.postMessage': 'special',
+    'chat.update': 3,
+    'chat.delete': 3,
+    'conversations.info': 3,
+    'reactions.add': 3,
+    'reactions.remove': 3
+}
+
+# Calls of a method that can go out at once before its rate applies
+SLACK_BURST = int(os.environ.get('SLACK_BURST', 5))
+
+# Times a throttled call is sent again, waiting the Retry-After Slack answers with
+SLACK_MAX_RETRIES = int(os.environ.get('SLACK_MAX_RETRIES', 5))
+
+# Block Kit limits, Slack rejects messages going over any of them
+SLACK_MAX_BLOCKS = 50
+SLACK_SECTION_TEXT_LIMIT = 3000
+SLACK_FIELD_TEXT_LIMIT = 2000
+SLACK_MAX_FIELDS = 10
+
+# Seconds between two chat.update of a progress message, the updates in between are coalesced
+SLACK_PROGRESS_INTERVAL = float(os.environ.get('SLACK_PROGRESS_INTERVAL', 2))
+
+# Characters of block text in a single message, above it the message moves on to a new one
+SLACK_MESSAGE_TEXT_LIMIT = int(os.environ.get('SLACK_MESSAGE_TEXT_LIMIT', 12000))
+
+# The production channel topic lists the open incidents like "Open incidents: INC-1, INC-2 | ..."
+INCIDENTS_PATTERN = re.compile(r"Open incidents: (.*)(?:\s[|])")
+
+# Seconds between the reads of the production channel topic by the incidents plugin
+SLACK_INCIDENTS_POLL_INTERVAL = int(os.environ.get('SLACK_INCIDENTS_POLL_INTERVAL', 60))
+
+# Seconds the incident state is trusted before a command reads the topic itself,
+# so the command still answers current incidents when the polling stopped
+SLACK_INCIDENTS_MAX_AGE = int(os.environ.get('SLACK_INCIDENTS_MAX_AGE', 5 * 60))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+_metrics = defaultdict(lambda: defaultdict(float))
+_metrics_lock = threading.Lock()
+
+
+class SlackWebClient(object):
+    """Slack Web API client over a keep-alive connection pool.
+    It's safe to share between threads and api_call answers like the SlackClient one"""
+
+    def __init__(self, token, api_url=SLACK_API_URL, pool_size=SLACK_POOL_SIZE, timeout=SLACK_TIMEOUT):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': 'Bearer {}'.format(token)})
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def api_call(self, method, **kwargs):
+        """Calls a Web API method and returns its decoded answer, lists and dicts
+        like blocks are sent JSON encoded the way the form encoded API expects them"""
+
+        data = {
+            key: json.dumps(value) if isinstance(value, (list, dict)) else value
+            for key, value in kwargs.items() if value is not None
+        }
+
+        time_start = time.monotonic()
+        try:
+            response = self.session.post(self.api_url + method, data=data, timeout=self.timeout)
+            result = response.json()
+            # Kept case insensitive, Slack may answer with a lowercase retry-after
+            result['headers'] = response.headers
+        except (requests.RequestException, ValueError) as error:
+            result = {'ok': False, 'error': str(error)}
+
+        record_call(method, time.monotonic() - time_start, result.get('ok', False))
+        return result
+
+
+def record_call(method, latency, ok):
+
+    with _metrics_lock:
+        counters = _metrics[method]
+        counters['calls'] += 1
+        counters['latency'] += latency
+        counters['max_latency'] = max(counters['max_latency'], latency)
+        if not ok:
+            counters['errors'] += 1
+
+def count(method, counter, value=1):
+
+    with _metrics_lock:
+        _metrics[method][counter] += value
+
+def call_stats():
+    """Returns the calls, errors, average and max latency, retries and merged messages of every Slack method"""
+
+    with _metrics_lock:
+        return {
+            method: {
+                'calls': int(counters['calls']),
+                'errors': int(counters['errors']),
+                'avg_latency': counters['latency'] / counters['calls'] if counters['calls'] else 0,
+                'max_latency': counters['max_latency'],
+                'retries': int(counters['retries']),
+                'merged': int(counters['merged'])
+            }
+            for method, counters in _metrics.items()
+        }
+
+
+OutboundCall = namedtuple('OutboundCall', 'token method kwargs future merge')
+
+# Seconds a lane of the outbound queue waits for new calls before its sender stops
+SLACK_LANE_IDLE = float(os.environ.get('SLACK_LANE_IDLE', 60))
+
+
+class OutboundLane(object):
+    """The calls sharing a rate limit, sent in order by their own sender thread"""
+
+    def __init__(self, key, bucket, lock):
+        self.key = key
+        self.bucket = bucket
+        self.pending = deque()
+        self.ready = threading.Condition(lock)
+        self.thread = None
+
+
+class OutboundQueue(object):
+    """Queue of Slack calls sent in order by background senders within the rate limit of each method.
+    Each rate limit, chat.postMessage per channel and the other methods per token, has its own lane
+    and sender, so waiting for one limit or for the Retry-After of a throttled call never holds
+    the calls of another. Messages waiting for the same channel and thread are merged into one,
+    and each call answers through a Future"""
+
+    def __init__(self, max_retries=SLACK_MAX_RETRIES, lane_idle=SLACK_LANE_IDLE):
+        self.max_retries = max_retries
+        self.lane_idle = lane_idle
+        self._lock = threading.Lock()
+        self._lanes = {}
+        self._buckets = {}
+
+    def put(self, token, method, merge=True, **kwargs):
+        """Queues a call, the returned Future resolves to the Slack response.
+        Without merge a message is always sent on its own, like a placeholder updated later"""
+
+        call = OutboundCall(token, method, kwargs, Future(), merge)
+        key = self.bucket_key(call)
+
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = OutboundLane(key, self.bucket(key), self._lock)
+            lane.pending.append(call)
+            if lane.thread is None:
+                lane.thread = threading.Thread(target=self._run, args=(lane,), name="slack-sender", daemon=True)
+                lane.thread.start()
+            lane.ready.notify()
+
+        return call.future
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(lane.pending) for lane in self._lanes.values())
+
+    @staticmethod
+    def bucket_key(call):
+        """Rate limit of a call, chat.postMessage is limited per channel and the other methods per token"""
+
+        tier = SLACK_METHOD_TIERS.get(call.method, 3)
+        channel = call.kwargs.get('channel') if tier == 'special' else None
+        return (call.token, call.method, channel)
+
+    def bucket(self, key):
+        """The token bucket of a rate limit, kept when its lane stops so the limit carries over"""
+
+        if key not in self._buckets:
+            rate = SLACK_TIER_RATES[SLACK_METHOD_TIERS.get(key[1], 3)]
+            self._buckets[key] = TokenBucket(rate, max(1, min(SLACK_BURST, int(rate * 60))))
+        return self._buckets[key]
+
+    def _run(self, lane):
+
+        while True:
+            with self._lock:
+                while not lane.pending:
+                    lane.ready.wait(self.lane_idle)
+                    if not lane.pending:
+                        # Idle, a later put starts a new sender
+                        del self._lanes[lane.key]
+                        lane.thread = None
+                        return
+
+            # Messages queued while waiting for the rate limit get merged into this one
+            lane.bucket.acquire()
+            self._send(self._take_batch(lane))
+
+    @staticmethod
+    def mergeable(call):
+
+        return call.merge and call.method == 'chat.postMessage' and isinstance(call.kwargs.get('blocks'), list)
+
+    def _take_batch(self, lane):
+        """Takes the first pending call of a lane and the next messages to the same thread
+        that fit in the same message, stopping at the first that doesn't to keep the order"""
+
+        with self._lock:
+            first = lane.pending.popleft()
+            batch = [first]
+            if not self.mergeable(first):
+                return batch
+
+            blocks = len(first.kwargs['blocks'])
+            text_size = sum(map(BlockKitBuilder.text_size, first.kwargs['blocks']))
+            while lane.pending:
+                call = lane.pending[0]
+                if (not self.mergeable(call)
+                        or call.kwargs.get('channel') != first.kwargs.get('channel')
+                        or call.kwargs.get('thread_ts') != first.kwargs.get('thread_ts')):
+                    break
+                call_text_size = sum(map(BlockKitBuilder.text_size, call.kwargs['blocks']))
+                if (blocks + len(call.kwargs['blocks']) > SLACK_MAX_BLOCKS
+                        or text_size + call_text_size > SLACK_MESSAGE_TEXT_LIMIT):
+                    break
+                batch.append(lane.pending.popleft())
+                blocks += len(call.kwargs['blocks'])
+                text_size += call_text_size
+
+        return batch
+
+    def _send(self, batch):
+
+        first = batch[0]
+        kwargs = dict(first.kwargs)
+        if len(batch) > 1:
+            kwargs['blocks'] = [block for call in batch for block in call.kwargs['blocks']]
+            kwargs['text'] = "\n".join(call.kwargs['text'] for call in batch if call.kwargs.get('text'))
+            count(first.method, 'merged', len(batch) - 1)
+
+        try:
+            response = self.call(first.token, first.method, kwargs)
+        except Exception as error:
+            for call in batch:
+                call.future.set_exception(error)
+            return
+
+        for call in batch:
+            call.future.set_result(response)
+
+    def call(self, token, method, kwargs):
+        """Calls the method, retrying it while Slack answers it's rate limited.
+        It runs on the sender of the lane of the call, so only that lane waits"""
+
+        for attempt in range(self.max_retries + 1):
+            response = get_client(token).api_call(method, **kwargs)
+            if response.get('error') != 'ratelimited' or attempt == self.max_retries:
+                return response
+
+            count(method, 'retries')
+            time.sleep(float(response.get('headers', {}).get('Retry-After', 1)))
+
+
+outbound = OutboundQueue()
+
+
+def chunk_lines(lines, limit):
+    """Joins lines into as few texts of up to limit characters as possible, a longer line is cut in pieces"""
+
+    chunks = []
+    text = ''
+
+    for line in lines:
+        for start in range(0, max(len(line), 1), limit - 1):
+            piece = line[start:start + limit - 1] + "\n"
+            if text and len(text) + len(piece) > limit:
+                chunks.append(text)
+                text = ''
+            text += piece
+
+    if text:
+        chunks.append(text)
+
+    return chunks
+
+def column_fields(left_lines, right_lines, limit=SLACK_FIELD_TEXT_LIMIT):
+    """Builds pairs of fields showing two columns side by side, a row is never split between pairs"""
+
+    texts = []
+    left = right = ''
+
+    for left_line, right_line in zip(left_lines, right_lines):
+        left_line = left_line[:limit - 1] + "\n"
+        right_line = right_line[:limit - 1] + "\n"
+        if left and (len(left) + len(left_line) > limit or len(right) + len(right_line) > limit):
+            texts += [left, right]
+            left = right = ''
+        left += left_line
+        right += right_line
+
+    if left:
+        texts += [left, right]
+
+    return [{"type" : "mrkdwn", "text" : text} for text in texts]
+
+
+class BlockKitBuilder(object):
+    """Builds a Block Kit report as a list of messages. The block count and text size of the
+    current message are measured as blocks are added, and a block that doesn't fit starts the next message"""
+
+    def __init__(self, max_blocks=SLACK_MAX_BLOCKS, max_text=SLACK_MESSAGE_TEXT_LIMIT):
+        self.max_blocks = max_blocks
+        self.max_text = max_text
+        self.messages = [[]]
+        self._text_size = 0
+
+    @staticmethod
+    def text_size(block):
+
+        texts = [block.get('text')] + block.get('fields', []) + block.get('elements', [])
+        return sum(len(text.get('text', '')) for text in texts if isinstance(text, dict))
+
+    def add(self, block):
+
+        size = self.text_size(block)
+        message = self.messages[-1]
+        if message and (len(message) >= self.max_blocks or self._text_size + size > self.max_text):
+            self.messages.append([])
+            self._text_size = 0
+
+        self.messages[-1].append(block)
+        self._text_size += size
+        return self
+
+    def add_divider(self):
+
+        return self.add({"type" : "divider"})
+
+    def add_text(self, lines):
+        """Adds lines of text in as few sections as the section text limit allows"""
+
+        for text in chunk_lines(lines, SLACK_SECTION_TEXT_LIMIT):
+            self.add({"type" : "section", "text" : {"type" : "mrkdwn", "text" : text}})
+        return self
+
+    def add_fields(self, fields):
+        """Adds fields in sections of up to ten fields"""
+
+        for start in range(0, len(fields), SLACK_MAX_FIELDS):
+            self.add({"type" : "section", "fields" : fields[start:start + SLACK_MAX_FIELDS]})
+        return self
+
+    def add_context(self, text):
+
+        return self.add({"type" : "context", "elements" : [{"type" : "mrkdwn", "text" : text}]})
+
 
 def get_client(slack_token):
+    """Returns the shared client of a token, it's created on first use"""
 
-    return SlackClient(slack_token)
+    with _clients_lock:
+        client = _clients.get(slack_token)
+        if client is None:
+            client = _clients[slack_token] = SlackWebClient(slack_token)
+        return client
 
-def get_prod_incidents_list():
+class IncidentState(object):
+    """Open incidents of the production channel, parsed once from its topic.
+    The incidents plugin keeps it current by polling the topic, a command only
+    asks conversations.info itself when the state is older than max_age seconds"""
+
+    def __init__(self, max_age=SLACK_INCIDENTS_MAX_AGE):
+        self.max_age = max_age
+        self.incidents = None
+        self.updated_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse(topic):
+        """Returns the open incidents listed on a topic, None when there are none"""
+
+        match_string = INCIDENTS_PATTERN.search(topic or '')
+        return match_string[1] if match_string else None
+
+    def set_topic(self, topic):
 
-    client = get_client(os.environ['SLACK_TOKEN'])
+        incidents = self.parse(topic)
+        with self._lock:
+            self.incidents = incidents
+            self.updated_at = time.monotonic()
 
-    response = client.api_call(
-        "conversations.info",
-        channel=os.environ['PRODUCTION_CHANNEL']
-    )['channel']['topic']['value']
+    def is_stale(self):
+
+        return self.updated_at is None or time.monotonic() - self.updated_at > self.max_age
+
+    def refresh(self):
+        """Reads the topic of the production channel"""
+
+        response = get_client(ssm_parameters.get('SLACK_TOKEN')).api_call(
+            "conversations.info",
+            channel=ssm_parameters.get('PRODUCTION_CHANNEL')
+        )
+        self.set_topic(response['channel']['topic']['value'])
+
+    def get(self):
+        """Returns the open incidents, reading the channel topic only when the state is stale"""
+
+        if self.is_stale():
+            self.refresh()
+        return self.incidents
+
+
+incident_state = IncidentState()
+
+def get_prod_incidents_list():
 
-    match_string = re.search("Open incidents: (.*)(?:\s[|])", response)
+    incidents = incident_state.get()
 
-    if match_string:
-        return "There are open incidents in the production Slack channel: {}".format(match_string[1])
+    if incidents:
+        return "There are open incidents in the production Slack channel: {}".format(incidents)
     else:
         return "There are no open incidents on the production Slack channel"
 
-def post_to_slack(channel_to_post, payload_message, text_message, thread_to_post = None):
-
-    client = get_client(os.environ['SLACK_MEESEEKS_API_KEY'])
+def enqueue_message(channel_to_post, payload_message, text_message, thread_to_post = None, merge = True):
+    """Queues a message for the background sender, the returned Future resolves to the Slack response.
+    Without merge it's never merged with the other messages waiting for the same thread"""
 
     # The message to be posted to slack is a more complex model using Slack blocks
     # needs to use this structure https://api.slack.com/tools/block-kit-builder
@@ -40,10 +465,128 @@ def post_to_slack(channel_to_post, payload_message, text_message, thread_to_post
     if thread_to_post:
         kwargs["thread_ts"] = thread_to_post
 
-    response = client.api_call(
-        'chat.postMessage',
-        **kwargs
-    )
+    return outbound.put(ssm_parameters.get('SLACK_MEESEEKS_API_KEY'), 'chat.postMessage', merge=merge, **kwargs)
+
+def post_report(channel_to_post, builder, text_message, thread_to_post = None):
+    """Posts the messages of a BlockKitBuilder, the first one to the channel and the
+    rest as replies in its thread, returning the response of the first one"""
+
+    messages = builder.messages
+    response = enqueue_message(channel_to_post, messages[0], text_message, thread_to_post).result()
+
+    if not response['ok']:
+        return "A problem happened to post to Slack"
+
+    thread_to_post = thread_to_post or response['ts']
+    follow_ups = [
+        enqueue_message(channel_to_post, blocks, text_message, thread_to_post) for blocks in messages[1:]
+    ]
+
+    if not all(follow_up.result()['ok'] for follow_up in follow_ups):
+        return "A problem happened to post to Slack"
+    return response
+
+class ProgressMessage(object):
+    """A placeholder message updated in place with chat.update while a command runs.
+    Updates closer than interval seconds are coalesced so only the latest one is sent,
+    and finish replaces the placeholder with the final report"""
+
+    def __init__(self, channel_to_post, thread_to_post = None, interval=SLACK_PROGRESS_INTERVAL):
+        self.channel = channel_to_post
+        self.thread = thread_to_post
+        self.interval = interval
+        self.ts = None
+        self._latest = None
+        self._sent_at = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def start(self, text):
+        """Posts the placeholder and waits for it, so the updates know which message to change.
+        It's sent on its own, merged with another message the updates would overwrite that one too"""
+
+        response = enqueue_message(
+            self.channel, BlockKitBuilder().add_text([text]).messages[0], text, self.thread, merge=False
+        ).result()
+        if response['ok']:
+            self.channel = response['channel']
+            self.ts = response['ts']
+            self._sent_at = time.monotonic()
+        return self
+
+    def update(self, text):
+        """Shows text in the placeholder, right away or once the interval since the last update passed"""
+
+        if self.ts is None:
+            return
+
+        with self._lock:
+            self._latest = text
+            if self._timer is not None:
+                return
+
+            wait = self._sent_at + self.interval - time.monotonic()
+            if wait <= 0:
+                self._send_latest()
+            else:
+                self._timer = threading.Timer(wait, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self):
+
+        with self._lock:
+            self._timer = None
+            if self._latest is not None:
+                self._send_latest()
+
+    def _send_latest(self):
+
+        text = self._latest
+        self._latest = None
+        self._sent_at = time.monotonic()
+        outbound.put(
+            ssm_parameters.get('SLACK_MEESEEKS_API_KEY'), 'chat.update',
+            channel=self.channel, ts=self.ts, text=text, blocks=BlockKitBuilder().add_text([text]).messages[0]
+        )
+
+    def _stop(self):
+
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._latest = None
+
+    def finish(self, builder, text_message):
+        """Replaces the placeholder with the first message of a BlockKitBuilder, the rest go in its thread"""
+
+        self._stop()
+        if self.ts is None:
+            return post_report(self.channel, builder, text_message, self.thread)
+
+        messages = builder.messages
+        response = outbound.put(
+            ssm_parameters.get('SLACK_MEESEEKS_API_KEY'), 'chat.update',
+            channel=self.channel, ts=self.ts, text=text_message, blocks=messages[0]
+        ).result()
+
+        follow_ups = [
+            enqueue_message(self.channel, blocks, text_message, self.thread or self.ts) for blocks in messages[1:]
+        ]
+
+        if not response['ok'] or not all(follow_up.result()['ok'] for follow_up in follow_ups):
+            return "A problem happened to post to Slack"
+        return response
+
+    def finish_text(self, text):
+        """Replaces the placeholder with a plain text answer"""
+
+        return self.finish(BlockKitBuilder().add_text([text]), text)
+
+def post_to_slack(channel_to_post, payload_message, text_message, thread_to_post = None):
+
+    response = enqueue_message(channel_to_post, payload_message, text_message, thread_to_post).result()
 
     if not response['ok']:
         return "A problem happened to post to Slack"
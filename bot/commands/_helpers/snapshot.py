@@ -0,0 +1,7 @@
+import time
+
+
+def is_stale(checked_at, max_age):
+    """Checks if a snapshot entry is older than max_age seconds"""
+
+    return checked_at is None or time.time() - checked_at > max_age
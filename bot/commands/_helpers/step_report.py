@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+from commands._helpers import octopus
+from commands._helpers.datastore import Table
+from commands._helpers.records import TemplateUsage, OutdatedTemplate
+from commands._helpers.snapshot import is_stale
+
+# Seconds a template usage is reused from the snapshot when its version didn't change
+STEP_SNAPSHOT_MAX_AGE = int(os.environ.get('STEP_SNAPSHOT_MAX_AGE', 6 * 60 * 60))
+
+# Seconds between the scheduled precomputes of the step template report
+STEP_REPORT_REFRESH = int(os.environ.get('STEP_REPORT_REFRESH', 10 * 60))
+
+# The snapshot of the usage of each template, usage rows are TemplateUsage records as lists
+STEP_USAGE_TABLE = Table(
+    'step_template_usage',
+    [('template_id', 'text'), ('version', 'integer'), ('checked_at', 'real'), ('usage', 'json')],
+    indexes=['checked_at']
+)
+
+# The last report posted, as OutdatedTemplate records
+STEP_REPORTS_TABLE = Table('step_reports', [('name', 'text'), ('reported_at', 'real'), ('report', 'json')])
+
+# The snapshot is shared by the step command and the scheduled precompute
+_snapshot_lock = threading.Lock()
+
+
+def load_step_snapshot(store):
+    """Loads the step template snapshot from the store"""
+
+    return {
+        'templates': {
+            row['template_id']: {'version': row['version'], 'checked_at': row['checked_at'], 'usage': row['usage']}
+            for row in store.query(STEP_USAGE_TABLE)
+        }
+    }
+
+
+def save_step_snapshot(store, templates, snapshot_templates):
+    """Writes only the templates of the snapshot that changed since it was loaded
+    with the given templates, and deletes the ones dropped from it"""
+
+    with store.transaction():
+        store.put_many(STEP_USAGE_TABLE, [
+            dict(entry, template_id=template_id) for template_id, entry in snapshot_templates.items()
+            if entry is not templates.get(template_id)
+        ])
+        store.delete_keys(STEP_USAGE_TABLE, [
+            template_id for template_id in templates if template_id not in snapshot_templates
+        ])
+
+
+def build_step_report(store, fresh=False, on_progress=None):
+    """Builds the list of Step Templates with Projects using an older version,
+    refreshing the snapshot of template usage kept in the store.
+    When fresh, the usage of every template is fetched again.
+    Returns the list and when the oldest usage it's built from was checked"""
+
+    if fresh:
+        octopus.cached_session.expire(octopus.STEP_TEMPLATES_URL)
+
+    template_list = octopus.get_step_template_list()
+
+    with _snapshot_lock:
+        snapshot = load_step_snapshot(store)
+        templates = dict(snapshot['templates'])
+        template_old_usage = get_template_old_usage(
+            template_list, snapshot, 0 if fresh else STEP_SNAPSHOT_MAX_AGE, on_progress
+        )
+        save_step_snapshot(store, templates, snapshot['templates'])
+
+    # Usage reused from the snapshot can be up to STEP_SNAPSHOT_MAX_AGE older than the report
+    checked_at = min((entry['checked_at'] for entry in snapshot['templates'].values()), default=time.time())
+
+    return template_old_usage, checked_at
+
+
+def mark_reported(store, template_old_usage):
+    """Saves the report that was posted, returning the one posted before it"""
+
+    with _snapshot_lock:
+        row = store.get(STEP_REPORTS_TABLE, 'last')
+        last_report = [OutdatedTemplate.from_json(report_row) for report_row in row['report']] if row else []
+        store.put(STEP_REPORTS_TABLE, {'name': 'last', 'reported_at': time.time(), 'report': template_old_usage})
+
+    return last_report
+
+
+def has_old_usage(template, template_usage):
+
+    return any(TemplateUsage._make(usage).version < template.version for usage in template_usage or [])
+
+
+def get_template_old_usage(template_list, snapshot, max_age=STEP_SNAPSHOT_MAX_AGE, on_progress=None):
+    """Builds the list of Step Templates with Projects using an older version.
+    The usage of a template is only fetched again when its version changed
+    since the snapshot or the snapshot entry is stale, the snapshot is updated in place.
+    on_progress(checked, total, outdated) is called as the usage of each template arrives"""
+
+    snapshot_templates = snapshot.get('templates', {})
+    template_old_usage = []
+
+    # Only the custom Step Templates are checked
+    custom_templates = [template for template in template_list if not template.community_id]
+
+    outdated_templates = []
+    for template in custom_templates:
+        snapshot_template = snapshot_templates.get(template.id)
+        if (snapshot_template is None
+                or snapshot_template['version'] != template.version
+                or is_stale(snapshot_template['checked_at'], max_age)):
+            outdated_templates.append(template)
+
+    # Templates reused from the snapshot count as already checked
+    progress_lock = threading.Lock()
+    checked = len(custom_templates) - len(outdated_templates)
+    outdated_ids = set(template.id for template in outdated_templates)
+    outdated = sum(
+        1 for template in custom_templates
+        if template.id not in outdated_ids and has_old_usage(template, snapshot_templates[template.id]['usage'])
+    )
+
+    def on_result(index, template_usage):
+        nonlocal checked, outdated
+        with progress_lock:
+            checked += 1
+            if has_old_usage(outdated_templates[index], template_usage):
+                outdated += 1
+            on_progress(checked, len(custom_templates), outdated)
+
+    # The usage of the changed templates is fetched in parallel
+    usage_list = octopus.get_template_usage_list(
+        (template.usage_url for template in outdated_templates),
+        on_result=on_result if on_progress is not None else None
+    )
+
+    # Usage records are saved as plain lists, the way JSON serializes tuples
+    checked_at = time.time()
+    for template, template_usage in zip(outdated_templates, usage_list):
+        snapshot_templates[template.id] = {
+            'version': template.version,
+            'checked_at': checked_at,
+            'usage': list(template_usage or [])
+        }
+
+    # Templates deleted from Octopus are dropped from the snapshot
+    snapshot['templates'] = {
+        template.id: snapshot_templates[template.id] for template in custom_templates
+    }
+
+    # Compare the usage of every template with its latest version
+    for template in custom_templates:
+        template_usage_list = tuple(
+            usage for usage in map(TemplateUsage._make, snapshot['templates'][template.id]['usage'])
+            if usage.version < template.version
+        )
+
+        if template_usage_list:
+            template_old_usage.append(OutdatedTemplate(template, template_usage_list))
+
+    return template_old_usage
+
+def get_report_changes(last_report, template_old_usage):
+    """Keeps only the Projects that weren't in the last report for the same template version"""
+
+    reported = set()
+    for template, usages in last_report:
+        for usage in usages:
+            reported.add((template.id, template.version, usage.project_name, usage.version))
+
+    changes = []
+    for template, usages in template_old_usage:
+        new_usage = tuple(
+            usage for usage in usages
+            if (template.id, template.version, usage.project_name, usage.version) not in reported
+        )
+        if new_usage:
+            changes.append(OutdatedTemplate(template, new_usage))
+
+    return changes
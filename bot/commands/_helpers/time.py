@@ -10,6 +10,12 @@ def how_long_ago(time_start):
 
     return pretty_time_delta(time_diff)
 
+def how_long_ago_timestamp(timestamp):
+
+    time_diff = datetime.now() - datetime.fromtimestamp(timestamp)
+
+    return pretty_time_delta(time_diff)
+
 def pretty_time_delta(full_datetime):
 
     time_in_seconds = full_datetime.days * 24 * 60 * 60
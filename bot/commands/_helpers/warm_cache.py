@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+
+from commands._helpers.singleflight import Group
+
+log = logging.getLogger(__name__)
+
+# Registered precomputes, by key: (compute function, refresh interval in seconds, callback names).
+# The compute function is called with fresh=True when a live fetch is asked,
+# and with the keyword arguments given to a foreground get, like a progress callback
+_computes = {}
+
+# Latest value of each precompute, by key: (value, computed at)
+_values = {}
+
+_locks = {}
+
+# Computes of the same key asked while one is running wait for it and share its result
+_in_flight = Group('precomputes')
+
+# Keyword arguments of the callers of each compute in flight, by (key, fresh),
+# their callbacks are all called by the one compute running
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+
+
+def register(key, compute, interval, callbacks=()):
+    """Registers a function whose result is precomputed every interval seconds by the scheduler.
+    The keyword arguments named in callbacks, like on_progress, are callbacks
+    called for every caller waiting for the compute, not only the one running it"""
+
+    _computes[key] = (compute, interval, tuple(callbacks))
+    _locks.setdefault(key, threading.Lock())
+
+
+def refresh(key, fresh=False, **kwargs):
+    """Runs the compute function of a key and stores its result.
+    A refresh asked while the same one is running returns the result of that one,
+    its callbacks are called along with the ones of the caller running it"""
+
+    flight = (key, fresh)
+    with _subscribers_lock:
+        _subscribers.setdefault(flight, []).append(kwargs)
+    try:
+        return _in_flight.do(flight, _refresh, key, fresh, **kwargs)
+    finally:
+        with _subscribers_lock:
+            subscribers = [subscriber for subscriber in _subscribers[flight] if subscriber is not kwargs]
+            if subscribers:
+                _subscribers[flight] = subscribers
+            else:
+                del _subscribers[flight]
+
+
+def _fan_out(flight, name):
+    """Callback calling the callback of that name of every caller of the flight"""
+
+    def callback(*args, **kwargs):
+        with _subscribers_lock:
+            callbacks = [subscriber[name] for subscriber in _subscribers.get(flight, ()) if subscriber.get(name)]
+        for subscriber_callback in callbacks:
+            try:
+                subscriber_callback(*args, **kwargs)
+            except Exception:
+                log.exception("%s callback of %s failed", name, flight[0])
+
+    return callback
+
+
+def _refresh(key, fresh, **kwargs):
+
+    compute, _, callbacks = _computes[key]
+    for name in callbacks:
+        kwargs[name] = _fan_out((key, fresh), name)
+
+    with _locks[key]:
+        value = compute(fresh, **kwargs)
+        _values[key] = (value, time.time())
+    return _values[key]
+
+
+def get(key, fresh=False, **kwargs):
+    """Returns the latest (value, computed at) of a key.
+    It is only computed in the foreground when there's no value yet or a fresh one is asked"""
+
+    if fresh or key not in _values:
+        return refresh(key, fresh, **kwargs)
+    return _values[key]
+
+
+def keys():
+    """Returns the registered keys"""
+
+    return list(_computes)
+
+
+def is_ready(key, fresh=False):
+    """Tells whether get would answer right away, without computing in the foreground"""
+
+    return not fresh and key in _values
+
+
+def computed_at(key):
+    """Returns when the value of a key was computed, None if never"""
+
+    if key not in _values:
+        return None
+    return _values[key][1]
+
+
+def age(key):
+    """Returns how many seconds ago the value of a key was computed, None if never"""
+
+    if key not in _values:
+        return None
+    return time.time() - _values[key][1]
+
+
+def refresh_due():
+    """Refreshes every key older than its interval, a failing compute keeps the previous value"""
+
+    for key, (_, interval, _) in list(_computes.items()):
+        key_age = age(key)
+        if key_age is not None and key_age < interval:
+            continue
+        try:
+            refresh(key)
+            log.info("Precomputed %s", key)
+        except Exception:
+            log.exception("Failed to precompute %s", key)
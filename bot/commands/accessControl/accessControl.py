@@ -0,0 +1,94 @@
+from errbot import BotPlugin, botcmd, cmdfilter
+import acl
+import os
+import ssm_parameters
+
+# Seconds between the reloads of the allowed channels and users from SSM
+ACL_REFRESH_INTERVAL = int(os.environ.get('ACL_REFRESH_INTERVAL', 60))
+
+ACL_PARAMETERS = ['ACL_ALLOWED_CHANNELS', 'ACL_ALLOWED_USERS']
+
+BLOCK_COMMAND = (None, None, None)
+
+class AccessControl(BotPlugin):
+    """Takes the place of errbot's ACLs core plugin, left out by CORE_PLUGINS in config.py.
+    The rules are the same, but compiled, and the allowed lists are kept current from SSM.
+    Until the rules are compiled every command is blocked"""
+
+    rules = None
+
+    def activate(self):
+        """Compiles the rules of the config, without any I/O, then starts reloading the allowed lists"""
+
+        self.rules = acl.AccessRules(
+            self.bot_config.ACCESS_CONTROLS,
+            self.bot_config.ACCESS_CONTROLS_DEFAULT,
+            self.bot_config.BOT_ADMINS
+        )
+        self.parameters = None
+        super().activate()
+        self.start_poller(ACL_REFRESH_INTERVAL, self.reload)
+
+    def reload(self):
+        """Recompiles the rules when the allowed channels or users changed, the checks
+        switch to the new rules at once. The values come from the secrets provider,
+        which fetches them from SSM again in the background once they're SECRETS_TTL old"""
+
+        try:
+            parameters = ssm_parameters.load(ACL_PARAMETERS)
+        except Exception:
+            self.log.exception("Failed to reload the allowed channels and users, keeping the current ones")
+            return
+
+        if parameters == self.parameters:
+            return
+
+        controls = acl.access_controls(
+            parameters['ACL_ALLOWED_CHANNELS'],
+            parameters['ACL_ALLOWED_USERS'],
+            getattr(self.bot_config, 'ACL_COMMAND_RULES', None)
+        )
+        self.rules = acl.AccessRules(controls, self.bot_config.ACCESS_CONTROLS_DEFAULT, self.bot_config.BOT_ADMINS)
+        self.parameters = parameters
+        self.log.info("Reloaded the access controls: %s", self.rules.stats())
+
+    @cmdfilter
+    def check_access(self, msg, cmd, args, dry_run):
+        """Blocks the commands the ACCESS_CONTROLS don't allow to the user, or from the channel"""
+
+        if self.rules is None:
+            return self.access_denied(msg, "The access controls aren't loaded yet, try again in a bit", dry_run)
+
+        command = self._bot.all_commands[cmd]
+        user = msg.frm.aclattr if hasattr(msg.frm, 'aclattr') else msg.frm.person
+
+        room = None
+        if msg.is_group:
+            room = msg.frm.room.aclattr if hasattr(msg.frm.room, 'aclattr') else str(msg.frm.room)
+
+        reason = self.rules.check(
+            "{}:{}".format(command.__self__.name, cmd),
+            user,
+            room,
+            args,
+            command._err_command_admin_only
+        )
+        if reason is None:
+            return msg, cmd, args
+
+        return self.access_denied(msg, reason, dry_run)
+
+    def access_denied(self, msg, reason, dry_run):
+
+        if not dry_run and not self.bot_config.HIDE_RESTRICTED_ACCESS:
+            self._bot.send_simple_reply(msg, reason)
+        return BLOCK_COMMAND
+
+    @botcmd
+    def acl(self, msg, args):
+        """This function shows how many channels and users are allowed,
+        and how many commands had their rule resolved"""
+
+        return "```\n{}\n```".format("\n".join(
+            "{:<12} {:>6}".format(key, value) for key, value in sorted(self.rules.stats().items())
+        ))
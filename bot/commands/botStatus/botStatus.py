@@ -0,0 +1,48 @@
+from errbot import BotPlugin, botcmd
+from commands._helpers import executor, singleflight
+import startup_profile
+
+class BotStatus(BotPlugin):
+
+    def callback_connect(self):
+        """Records when the bot got connected, the end of the startup"""
+
+        startup_profile.mark('connected')
+        if startup_profile.enabled:
+            self.log.info("Startup profile:\n%s", "\n".join(startup_profile.report()))
+
+    @botcmd
+    def startup(self, msg, args):
+        """This function shows the startup milestones, and with STARTUP_PROFILE=1
+        the import time and memory of the plugins and of the slowest modules"""
+
+        lines = startup_profile.report()
+        lines.append("{:<28} {:>18.1f} MB".format('current RSS', startup_profile.rss() / 1024 / 1024))
+
+        return "```\n{}\n```".format("\n".join(lines))
+
+    @botcmd
+    def pools(self, msg, args):
+        """This function shows the worker pools of the expensive commands,
+        how busy they are and how long the commands wait and run,
+        and how many identical requests were merged into one in flight"""
+
+        stats = executor.pool_stats()
+        lines = ["{:<10} {:>7} {:>6} {:>9} {:>8} {:>16} {:>16}".format(
+            'pool', 'running', 'queued', 'completed', 'rejected', 'wait avg/max', 'run avg/max'
+        )]
+        for name, pool in sorted(stats.items()):
+            lines.append("{:<10} {:>3}/{:<3} {:>3}/{:<2} {:>9} {:>8} {:>7.2f}/{:<7.2f}s {:>7.2f}/{:<7.2f}s".format(
+                name,
+                pool['running'], pool['max_concurrency'],
+                pool['queued'], pool['max_queue'],
+                pool['completed'], pool['rejected'],
+                pool['avg_wait'], pool['max_wait'],
+                pool['avg_run'], pool['max_run']
+            ))
+
+        lines.append("{:<18} {:>8} {:>8} {:>9}".format('single flight', 'calls', 'merged', 'in flight'))
+        for name, group in sorted(singleflight.stats().items()):
+            lines.append("{:<18} {:>8} {:>8} {:>9}".format(name, group['calls'], group['merged'], group['in_flight']))
+
+        return "```\n{}\n```".format("\n".join(lines))
@@ -0,0 +1,24 @@
+from errbot import BotPlugin, botcmd
+from commands._helpers import slack
+
+class Incidents(BotPlugin):
+
+    def activate(self):
+        """Keeps the incident state current by reading the production channel topic
+        every SLACK_INCIDENTS_POLL_INTERVAL seconds, the incidents command answers from it"""
+
+        super().activate()
+        self.start_poller(slack.SLACK_INCIDENTS_POLL_INTERVAL, self.refresh_incidents)
+
+    def refresh_incidents(self):
+
+        try:
+            slack.incident_state.refresh()
+        except Exception:
+            self.log.exception("Failed to read the production channel topic")
+
+    @botcmd
+    def incidents(self, msg, args):
+        """This function tells whether there are open incidents on the production Slack channel"""
+
+        return slack.get_prod_incidents_list()
@@ -0,0 +1,80 @@
+from errbot import BotPlugin, re_botcmd
+from commands._helpers import datastore, octopus, slack, warm_cache
+from commands._helpers.executor import pooled
+from commands._helpers.time import how_long_ago_timestamp
+
+# Emoji used to show each phase of a release progression
+PHASE_ICONS = {
+    'Complete' : ':white_check_mark:',
+    'Current' : ':arrow_forward:',
+    'Pending' : ':white_circle:'
+}
+
+class ReleaseStatus(BotPlugin):
+
+    def activate(self):
+        """Starts the project index so project lookups don't need a request"""
+
+        super().activate()
+        octopus.project_index.start(datastore.open_store(self.bot_config.BOT_DATA_DIR))
+
+    @re_botcmd(pattern=r"(?:releasestatus|releases|dashboard)(\s+(?:--|\u2014)fresh)?")
+    @pooled('releases', max_concurrency=2, max_queue=4)
+    def get_release_status(self, msg, match):
+        """This commands searches on the Octopus API for the latest Release
+        of every Project in the Project Groups, and its progression through the
+        lifecycle phases, and generate a dashboard message to the slack.
+        The latest scheduled dashboard is used unless --fresh is given.
+        It runs on the releases worker pool, so it doesn't hold the command threads"""
+
+        self._bot.add_reaction(msg, "hourglass")
+
+        # Receives the channel id where the message was posted
+        channel_to_post = msg.frm.channelid
+
+        release_statuses, computed_at = warm_cache.get('release_statuses', fresh=bool(match.group(1)))
+
+        builder = slack.BlockKitBuilder()
+        builder.add_text(["Latest *Release* of *{}* Projects on Octopus:".format(len(release_statuses))])
+        builder.add_divider()
+
+        for group_name in octopus.PROJECT_GROUPS.values():
+            lines = ["*{}*".format(group_name)]
+
+            for status in release_statuses:
+                if status.project.group_name == group_name:
+                    lines.append(self.format_status(status))
+
+            if len(lines) > 1:
+                builder.add_text(lines)
+
+        builder.add_context("Updated {} ago".format(how_long_ago_timestamp(computed_at)))
+
+        slack.post_report(channel_to_post, builder, 'Octopus Release dashboard')
+        self._bot.remove_reaction(msg, "hourglass")
+        self._bot.add_reaction(msg, "heavy_check_mark")
+
+    @staticmethod
+    def format_status(status):
+        """Formats a single Project line of the dashboard"""
+
+        project = status.project
+
+        if status.error is not None:
+            return "><{}|{}> :warning: {}".format(project.url, project.name, status.error)
+
+        if status.release is None:
+            return "><{}|{}> no releases".format(project.url, project.name)
+
+        phases = " ".join(
+            "{} {}".format(PHASE_ICONS.get(phase.progress, ':grey_question:'), phase.name)
+            for phase in status.phases
+        )
+
+        return "><{}|{}> <{}|{}> {}".format(
+            project.url,
+            project.name,
+            status.release_url,
+            status.release.version,
+            phases
+        )
@@ -0,0 +1,28 @@
+from errbot import BotPlugin, botcmd
+from errcron.bot import CrontabMixin
+from commands._helpers import warm_cache
+from commands._helpers.time import how_long_ago_timestamp
+
+class Scheduler(CrontabMixin, BotPlugin):
+
+    # Every minute the precomputes older than their own refresh interval are run again,
+    # CrontabMixin.activate starts the poller running them
+    CRONTAB = [
+        '* * * * * .refresh_precomputes'
+    ]
+
+    def refresh_precomputes(self, polled_time):
+        """Refreshes the registered precomputes that are due"""
+
+        warm_cache.refresh_due()
+
+    @botcmd
+    def precomputes(self, msg, args):
+        """This function lists the precomputed reports and how old they are"""
+
+        for key in sorted(warm_cache.keys()):
+            computed_at = warm_cache.computed_at(key)
+            if computed_at is None:
+                yield "{}: not computed yet".format(key)
+            else:
+                yield "{}: updated {} ago".format(key, how_long_ago_timestamp(computed_at))
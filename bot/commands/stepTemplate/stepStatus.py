@@ -1,122 +1,128 @@
 from errbot import BotPlugin, re_botcmd
-from commands._helpers import octopus, slack
+from commands._helpers import datastore, octopus, slack, step_report, warm_cache
+from commands._helpers.executor import pooled
+from commands._helpers.time import how_long_ago_timestamp
 import json
 
 class StepTemplate(BotPlugin):
 
-    @re_botcmd(pattern=r"(?:step|steptemplate|stepstatus)")
+    def activate(self):
+        """Starts the project index so project lookups don't need a request,
+        and registers the step template report to be precomputed by the scheduler"""
+
+        super().activate()
+        octopus.project_index.start(self.store())
+        self.register_precompute()
+
+    def register_precompute(self):
+
+        warm_cache.register(
+            'step_report',
+            lambda fresh, **kwargs: step_report.build_step_report(self.store(), fresh, **kwargs),
+            step_report.STEP_REPORT_REFRESH,
+            callbacks=('on_progress',)
+        )
+
+    @re_botcmd(pattern=r"(?:steptemplate|stepstatus|step)(?:\s+(diff|changes))?(\s+(?:--|\u2014)fresh)?")
+    @pooled('step', max_concurrency=2, max_queue=4)
     def get_step_update_status(self, msg, match):
         """This commands searches on the Octopus API for Projects
         using and older version of the Step Templates
-        and generate a message to the slack with the list"""
+        and generate a message to the slack with the list.
+        With diff, only the changes since the last report are sent.
+        The latest scheduled report is used unless --fresh is given,
+        a report built on the spot shows its progress in a placeholder message.
+        It runs on the step worker pool, so it doesn't hold the command threads"""
 
         self._bot.add_reaction(msg, "hourglass")
 
-        OCTOPUS_URL = "https://octopus.com/app#/Spaces-1/"
-        template_list = octopus.get_step_template_list()
+        only_changes = bool(match.group(1))
+        fresh = bool(match.group(2))
 
         # Receives the channel id where the message was posted
         channel_to_post = msg.frm.channelid
-        template_old_usage = []
 
-        if 'ErrorMessage' in template_list:
-            self._bot.remove_reaction(msg, "hourglass")
-            self._bot.add_reaction(msg, "warning")
-            yield "Octopus Error: {}".format(template_list['ErrorMessage'])
+        progress = None
+        kwargs = {}
+        if not warm_cache.is_ready('step_report', fresh):
+            progress = slack.ProgressMessage(channel_to_post).start("Checking the Step Templates on Octopus...")
+            kwargs['on_progress'] = lambda checked, total, outdated: progress.update(
+                "Checked {}/{} Step Templates, {} with Projects using an older version so far...".format(checked, total, outdated)
+            )
+
+        try:
+            (template_old_usage, checked_at), computed_at = warm_cache.get('step_report', fresh=fresh, **kwargs)
+        except octopus.OctopusError as error:
+            yield from self.failed(msg, progress, "Octopus Error: {}".format(error))
+            return
+        except Exception as error:
+            # Like a request still failing after the scheduler retries, the placeholder isn't left behind
+            self.log.exception("Failed to build the Step Template report")
+            yield from self.failed(msg, progress, "Failed to check the Step Templates: {}".format(error))
             return
 
-        # Iterate through Octopus API to get the list of Step Templates
-        for template in template_list:
-            if not template['CommunityActionTemplateId']:
-
-                template_usage = octopus.get_template_usage(template['Links']['Usage'])
-
-                if template_usage:
-                    template_usage_list = []
-
-                    for usage in template_usage:
-                        if int(usage['Version']) < int(template['Version']):
-                            template_usage_list.append({
-                                'Name' : usage['ProjectName'],
-                                'Version' : usage['Version']
-                            })
-
-                    if template_usage_list:
-                        template_url = OCTOPUS_URL + "library/steptemplates/" + template['Id'] + "/usage"
-                        template_old_usage.append({
-                            'Name' : template['Name'],
-                            'Version' : template['Version'],
-                            'TemplateUrl' : template_url,
-                            'Usage' : template_usage_list,
-                        })
-
-        # if there's projects using an old step template version, start building a json message to post to slack
-        if template_old_usage:
-            payload_message = [
-                {
-                    "type" : "section",
-                    "text" : {
-                        "type" : "mrkdwn",
-                        "text" : "The following *Projects* are using an older version of the *Step Templates*:"
-                    }
-                },
-                {
-                    "type" : "divider"
-                },
-                {
-                    "type" : "section",
-                    "fields" : [
-                        {
-                            "type" : "mrkdwn",
-                            "text" : "*Step Template:*"
-                        },
-                        {
-                            "type" : "mrkdwn",
-                            "text" : "*Version:*"
-                        }
-                    ]
-                }
-            ]
-
-            for template in template_old_usage:
-                step_name = ''
-                step_version = ''
-                count_limit = 0
-
-                for usage in template['Usage']:
-                    step_name += ">{}\n".format(usage['Name'])
-                    step_version += "{}\n".format(usage['Version'])
-
-                    count_limit += 1
-                    if count_limit >= 5:
-                        step_name += "<{}|More..>\n".format(template['TemplateUrl'])
-                        step_version += "\n"
-                        break
-
-                payload_message.append(
-                    {
-                        'type' : 'section',
-                        'fields' : [
-                            {
-                                'type' : 'mrkdwn',
-                                'text' : "<{}|{}>".format(template['TemplateUrl'], template['Name'])
-                            },
-                            {
-                                'type' : 'mrkdwn',
-                                'text' : "{}".format(template['Version'])
-                            },
-                            {
-                                'type' : 'mrkdwn',
-                                'text' : step_name
-                            },
-                            {
-                                'type' : 'mrkdwn',
-                                'text' : step_version
-                            }
-                        ]
-                    }
-                )
+        last_report = step_report.mark_reported(self.store(), template_old_usage)
+
+        if only_changes:
+            template_old_usage = step_report.get_report_changes(last_report, template_old_usage)
 
-            slack.post_to_slack(channel_to_post, payload_message, 'Notify Octopus Step Template changes')
+        if not template_old_usage:
             self._bot.remove_reaction(msg, "hourglass")
             self._bot.add_reaction(msg, "heavy_check_mark")
+            if only_changes:
+                yield from self.reply(progress, "No Step Template changes since the last report")
+            else:
+                yield from self.reply(progress, "All Projects are using the latest version of the Step Templates")
+            return
+
+        builder = self.build_payload(template_old_usage)
+        builder.add_context("Updated {} ago, from Step Template usage checked up to {} ago".format(
+            how_long_ago_timestamp(computed_at), how_long_ago_timestamp(checked_at)
+        ))
+
+        if progress is None:
+            slack.post_report(channel_to_post, builder, 'Notify Octopus Step Template changes')
+        else:
+            progress.finish(builder, 'Notify Octopus Step Template changes')
+        self._bot.remove_reaction(msg, "hourglass")
+        self._bot.add_reaction(msg, "heavy_check_mark")
+
+    def store(self):
+
+        return datastore.open_store(self.bot_config.BOT_DATA_DIR)
+
+    def failed(self, msg, progress, text):
+        """Swaps the hourglass for a warning and answers with the error"""
+
+        self._bot.remove_reaction(msg, "hourglass")
+        self._bot.add_reaction(msg, "warning")
+        yield from self.reply(progress, text)
+
+    @staticmethod
+    def reply(progress, text):
+        """Answers in the progress message when there is one, otherwise as a normal reply"""
+
+        if progress is None:
+            yield text
+        else:
+            progress.finish_text(text)
+
+    @staticmethod
+    def build_payload(template_old_usage):
+        """Builds the messages to post to slack, a long report is split over a thread"""
+
+        builder = slack.BlockKitBuilder()
+        builder.add_text(["The following *Projects* are using an older version of the *Step Templates*:"])
+        builder.add_divider()
+        builder.add_fields(slack.column_fields(["*Step Template:*"], ["*Version:*"]))
+
+        for template, usages in template_old_usage:
+            builder.add_fields(
+                slack.column_fields(["<{}|{}>".format(template.url, template.name)], ["{}".format(template.version)])
+                + slack.column_fields(
+                    [">{}".format(usage.project_name) for usage in usages],
+                    ["{}".format(usage.version) for usage in usages]
+                )
+            )
+
+        return builder
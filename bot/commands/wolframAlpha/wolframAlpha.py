@@ -1,36 +1,159 @@
 from errbot import BotPlugin, botcmd
-import wolframalpha
+from commands._helpers import datastore
+from commands._helpers.cache import PersistentLRUCache
+from commands._helpers.executor import send_reply
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import ssm_parameters
 import os
 
+log = logging.getLogger(__name__)
+
+# Seconds an answer is served from the cache before Wolfram Alpha is asked again
+WOLFRAM_CACHE_TTL = int(os.environ.get('WOLFRAM_CACHE_TTL', 24 * 60 * 60))
+WOLFRAM_CACHE_SIZE = int(os.environ.get('WOLFRAM_CACHE_SIZE', 512))
+
+# Seconds to wait for an answer, the query is also cut on the Wolfram Alpha side
+WOLFRAM_TIMEOUT = int(os.environ.get('WOLFRAM_TIMEOUT', 10))
+
+# Queries running at once, off the command threads
+WOLFRAM_MAX_WORKERS = int(os.environ.get('WOLFRAM_MAX_WORKERS', 4))
+
+# Only the pods the answer is made of are asked for, as plain text
+WOLFRAM_PARAMS = (
+    ('podtitle', 'Result'),
+    ('podtitle', 'Results'),
+    ('format', 'plaintext'),
+    ('totaltimeout', WOLFRAM_TIMEOUT)
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the client shared by every query, wolframalpha is only imported
+    when the first query is made"""
+
+    global _client
+    with _client_lock:
+        if _client is None:
+            import wolframalpha
+            _client = wolframalpha.Client(ssm_parameters.get("WOLFRAM_ALPHA_API_ID"))
+        return _client
+
+
+def normalize_query(query):
+    """Queries differing only in case or spacing share their cache entry"""
+
+    return " ".join(query.lower().split())
+
+
+def query_answer(query):
+    """Asks Wolfram Alpha and joins the plaintext of its Result pods, empty when it has none"""
+
+    answer = ""
+    ask = get_client().query(query, params=WOLFRAM_PARAMS)
+
+    try:
+        for pod in ask.pods:
+            if pod.title in ["Result", "Results"]:
+                for sub in pod.subpods:
+                    answer += sub.plaintext
+    except AttributeError:
+        log.info("KeyError triggered on retrieving pods.")
+
+    return answer
+
+
+class PendingQuery(object):
+    """Replies to a query exactly once, with its answer or with the timeout message"""
+
+    def __init__(self, plugin, msg):
+        self.plugin = plugin
+        self.msg = msg
+        self._replied = False
+        self._lock = threading.Lock()
+
+    def reply(self, text):
+
+        with self._lock:
+            if self._replied:
+                return
+            self._replied = True
+
+        send_reply(self.plugin, self.msg, text)
+
+
 class WolframAlpha(BotPlugin):
 
+    def activate(self):
+        """Loads the answers cached by a previous run and starts the query workers"""
+
+        super().activate()
+        self.cache = PersistentLRUCache(
+            datastore.open_store(self.bot_config.BOT_DATA_DIR), 'wolfram_answers', WOLFRAM_CACHE_SIZE
+        )
+        self.executor = ThreadPoolExecutor(max_workers=WOLFRAM_MAX_WORKERS)
+
+    def deactivate(self):
+
+        self.executor.shutdown(wait=False)
+        super().deactivate()
+
     # Define the wa as the call for the wolfram alpha command query
     @botcmd
     def wa(self, msg, arg):
         """This function searchs any information on the WolframAlpha engine
         It only shows the result on the plaintext field of the json response
-        of the api query"""
+        of the api query. Answers are cached, a new query is answered once it's found"""
 
         if arg:
-            yield "Ooohhh can do, let me search that.. "
+            key = normalize_query(arg)
+            answer = self.cache.get(key)
+
+            if answer is not None:
+                yield self.format_answer(answer)
+                return
 
-            client = wolframalpha.Client(os.environ["WOLFRAM_ALPHA_API_ID"])
+            yield "Ooohhh can do, let me search that.. "
 
-            answer  = ""
-            ask = client.query(arg)
+            pending = PendingQuery(self, msg)
+            future = self.executor.submit(query_answer, arg)
 
-            try:
-                for pod in ask.pods:
-                    if pod.title in ["Result", "Results"]:
-                        for sub in pod.subpods:
-                            answer += sub.plaintext
-            except AttributeError:
-                log.info("KeyError triggered on retrieving pods.")
+            timer = threading.Timer(
+                WOLFRAM_TIMEOUT, pending.reply, ("Wolfram Alpha is taking too long, try again in a bit..",)
+            )
+            timer.daemon = True
+            timer.start()
 
-            if answer:
-                yield "This is your answer: {}".format(answer)
-            else:
-                yield "You probably didn't ask me right, I've found nothing.."
+            future.add_done_callback(lambda future: self.answered(pending, key, future, timer))
 
         else:
             yield "Ooohhh, you need to say something for me to search on Wolfram Alpha.."
+
+    def answered(self, pending, key, future, timer):
+        """Caches the answer of a query and replies with it, a late answer is only cached.
+        Empty answers aren't cached"""
+
+        timer.cancel()
+
+        try:
+            answer = future.result()
+        except Exception as error:
+            self.log.exception("Wolfram Alpha query failed")
+            pending.reply("Wolfram Alpha failed to answer: {}".format(error))
+            return
+
+        # An empty answer can be a timeout or a hiccup of the API, it's asked again next time
+        if answer:
+            self.cache.set(key, answer, WOLFRAM_CACHE_TTL)
+        pending.reply(self.format_answer(answer))
+
+    @staticmethod
+    def format_answer(answer):
+
+        if answer:
+            return "This is your answer: {}".format(answer)
+        return "You probably didn't ask me right, I've found nothing.."
@@ -1,6 +1,14 @@
 import logging
 import os
+import acl
+import startup_profile
+
+# STARTUP_PROFILE=1 records the import time and memory of every module and plugin,
+# the botStatus plugin shows the report
+startup_profile.enable(os.environ.get('STARTUP_PROFILE') == '1')
+
 import config_env
+startup_profile.mark('config loaded')
 
 BACKEND = 'Slack'
 
@@ -27,8 +35,18 @@ BOT_ALT_PREFIX_CASEINSENSITIVE = True
 
 BOT_ALT_PREFIXES = os.environ['BOT_PREFIXES'].split(',')
 
-array_allowed_channels =  os.environ['ACL_ALLOWED_CHANNELS'].replace(' ', '').split(',')
-array_allowed_users =  os.environ['ACL_ALLOWED_USERS'].replace(' ', '').split(',')
-
-ACCESS_CONTROLS = {'*': {'allowrooms': array_allowed_channels },
-                   '*': {'allowusers': array_allowed_users } }
+# The accessControl plugin checks the ACCESS_CONTROLS instead of errbot's ACLs plugin,
+# it reloads the allowed channels and users from SSM without a restart
+CORE_PLUGINS = ('Backup', 'ChatRoom', 'CommandNotFoundFilter', 'Flows', 'Health', 'Help',
+                'Plugins', 'TextCmds', 'Utils', 'VersionChecker', 'Webserver')
+
+# Rules of single commands, like {'stepTemplate:*': {'allowrooms': ['#releases']}},
+# in the ACCESS_CONTROLS format. The first pattern matching a command gives its rule
+ACL_COMMAND_RULES = {}
+
+# Every other command can be used by the allowed users from the allowed channels
+ACCESS_CONTROLS = acl.access_controls(
+    os.environ['ACL_ALLOWED_CHANNELS'],
+    os.environ['ACL_ALLOWED_USERS'],
+    ACL_COMMAND_RULES
+)
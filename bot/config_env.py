@@ -1,35 +1,21 @@
 import os
-import boto3
+from ssm_parameters import SecretsProvider, install
 
-ssm_client = boto3.client(
-    'ssm',
-    region_name=os.environ["AWS_DEFAULT_REGION"]
-)
 
-os.environ['DEBUG'] = ssm_client.get_parameter(Name='/debug')['Parameter']['Value']
+def create_ssm_client():
+    """boto3 takes a while to import, it's only done when a secret has to be fetched"""
 
-os.environ['GITHUB_TOKEN'] = ssm_client.get_parameter(Name='/github-token', WithDecryption=True)['Parameter']['Value']
-os.environ['PAGERDUTY_TOKEN'] = ssm_client.get_parameter(Name='/pagerduty-token', WithDecryption=True)['Parameter']['Value']
-os.environ['OCTOPUS_API_KEY'] = ssm_client.get_parameter(Name='/octopus-api-key', WithDecryption=True)['Parameter']['Value']
-os.environ['SLACK_TOKEN'] = ssm_client.get_parameter(Name='/slack-token', WithDecryption=True)['Parameter']['Value']
-os.environ['SLACK_MEESEEKS_API_KEY'] = ssm_client.get_parameter(Name='/slack-meeseeks-api-key', WithDecryption=True)['Parameter']['Value']
-os.environ['WOLFRAM_ALPHA_API_ID'] = ssm_client.get_parameter(Name='/wolfram-alpha-api-id', WithDecryption=True)['Parameter']['Value']
+    import boto3
+    return boto3.client('ssm', region_name=os.environ["AWS_DEFAULT_REGION"])
 
-os.environ['PRODUCTION_CHANNEL'] = ssm_client.get_parameter(Name='/production-channel')['Parameter']['Value']
-os.environ['SLACK_CHANNEL'] = ssm_client.get_parameter(Name='/slack-channel')['Parameter']['Value']
-os.environ['SLACK_SERVICE_ID'] = ssm_client.get_parameter(Name='/pd-service-id')['Parameter']['Value']
 
-os.environ['BOT_PREFIXES'] = ssm_client.get_parameter(Name='/bot-prefixes')['Parameter']['Value']
+# Secrets are fetched from SSM when first used, see ssm_parameters.py.
+# With SECRETS_CACHE_KEY, a Fernet key, they are also kept encrypted for the next start
+secrets = install(SecretsProvider(
+    create_ssm_client,
+    cache_path=os.environ.get('SECRETS_CACHE_PATH', '/bot/data/secrets.cache'),
+    cache_key=os.environ.get('SECRETS_CACHE_KEY')
+))
 
-os.environ['ACL_ALLOWED_CHANNELS'] = ssm_client.get_parameter(Name='/acl-allowed-channels')['Parameter']['Value']
-os.environ['ACL_ALLOWED_USERS'] = ssm_client.get_parameter(Name='/acl-allowed-users')['Parameter']['Value']
-
-os.environ['NR_BASE_URL'] = ssm_client.get_parameter(Name='/newrelic_base_url')['Parameter']['Value']
-os.environ['NR_USER_ID'] = ssm_client.get_parameter(Name='/newrelic_user_id')['Parameter']['Value']
-os.environ['NR_PS_ACCOUNT_ID'] = ssm_client.get_parameter(Name='/newrelic_ps_account_id')['Parameter']['Value']
-os.environ['NR_PS_API_KEY'] = ssm_client.get_parameter(Name='/newrelic_ps_api_key', WithDecryption=True)['Parameter']['Value']
-os.environ['NR_PRAC_ACCOUNT_ID'] = ssm_client.get_parameter(Name='/newrelic_prac_account_id')['Parameter']['Value']
-os.environ['NR_PRAC_API_KEY'] = ssm_client.get_parameter(Name='/newrelic_prac_api_key', WithDecryption=True)['Parameter']['Value']
-
-os.environ['MW_SLACK_CHANNEL'] = ssm_client.get_parameter(Name='/mw-notification/slack-channel')['Parameter']['Value']
-os.environ['MW_TEMPLATE_URL'] = ssm_client.get_parameter(Name='/mw-notification/template-url')['Parameter']['Value']
+# Only the parameters config.py needs to connect are loaded at startup, in a single call
+os.environ.update(secrets.load(['DEBUG', 'SLACK_TOKEN', 'BOT_PREFIXES', 'ACL_ALLOWED_CHANNELS', 'ACL_ALLOWED_USERS']))
@@ -0,0 +1,290 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# Environment variables of the bot and the SSM parameters they are loaded from
+SSM_PARAMETERS = [
+    ('DEBUG', '/debug'),
+
+    ('GITHUB_TOKEN', '/github-token'),
+    ('PAGERDUTY_TOKEN', '/pagerduty-token'),
+    ('OCTOPUS_API_KEY', '/octopus-api-key'),
+    ('SLACK_TOKEN', '/slack-token'),
+    ('SLACK_MEESEEKS_API_KEY', '/slack-meeseeks-api-key'),
+    ('WOLFRAM_ALPHA_API_ID', '/wolfram-alpha-api-id'),
+
+    ('PRODUCTION_CHANNEL', '/production-channel'),
+    ('SLACK_CHANNEL', '/slack-channel'),
+    ('SLACK_SERVICE_ID', '/pd-service-id'),
+
+    ('BOT_PREFIXES', '/bot-prefixes'),
+
+    ('ACL_ALLOWED_CHANNELS', '/acl-allowed-channels'),
+    ('ACL_ALLOWED_USERS', '/acl-allowed-users'),
+
+    ('NR_BASE_URL', '/newrelic_base_url'),
+    ('NR_USER_ID', '/newrelic_user_id'),
+    ('NR_PS_ACCOUNT_ID', '/newrelic_ps_account_id'),
+    ('NR_PS_API_KEY', '/newrelic_ps_api_key'),
+    ('NR_PRAC_ACCOUNT_ID', '/newrelic_prac_account_id'),
+    ('NR_PRAC_API_KEY', '/newrelic_prac_api_key'),
+
+    ('MW_SLACK_CHANNEL', '/mw-notification/slack-channel'),
+    ('MW_TEMPLATE_URL', '/mw-notification/template-url')
+]
+
+# GetParameters accepts up to 10 names per call
+SSM_BATCH_SIZE = 10
+
+# Seconds a secret is used before it's fetched again in the background
+SECRETS_TTL = int(os.environ.get('SECRETS_TTL', 15 * 60))
+
+# Seconds between the checks of the background refresh
+SECRETS_REFRESH_INTERVAL = int(os.environ.get('SECRETS_REFRESH_INTERVAL', 60))
+
+
+def get_parameter_batch(ssm_client, names):
+    """Returns the values of up to 10 parameters found with a single GetParameters call"""
+
+    response = ssm_client.get_parameters(Names=names, WithDecryption=True)
+    return {parameter['Name']: parameter['Value'] for parameter in response['Parameters']}
+
+
+def get_parameters_by_path(ssm_client, names, path='/'):
+    """Looks for the given parameters walking every parameter under path"""
+
+    values = {}
+    kwargs = {'Path': path, 'Recursive': True, 'WithDecryption': True}
+
+    while True:
+        response = ssm_client.get_parameters_by_path(**kwargs)
+        for parameter in response['Parameters']:
+            if parameter['Name'] in names:
+                values[parameter['Name']] = parameter['Value']
+
+        if 'NextToken' not in response or len(values) == len(names):
+            return values
+        kwargs['NextToken'] = response['NextToken']
+
+
+def fetch_parameters(ssm_client, names, max_workers=4):
+    """Fetches parameters with concurrent GetParameters batches, returning them by name.
+    Parameters a batch didn't return, or whose batch failed, are looked up by path"""
+
+    names = sorted(set(names))
+    batches = [names[start:start + SSM_BATCH_SIZE] for start in range(0, len(names), SSM_BATCH_SIZE)]
+
+    def load_batch(batch):
+        try:
+            return get_parameter_batch(ssm_client, batch)
+        except Exception as error:
+            log.warning("GetParameters failed, falling back to GetParametersByPath: %s", error)
+            return {}
+
+    values = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch_values in executor.map(load_batch, batches):
+            values.update(batch_values)
+
+    missing = [name for name in names if name not in values]
+    if missing:
+        values.update(get_parameters_by_path(ssm_client, set(missing)))
+
+    missing = [name for name in names if name not in values]
+    if missing:
+        raise LookupError("SSM parameters not found: {}".format(", ".join(missing)))
+
+    return values
+
+
+def load_parameters(ssm_client, manifest=SSM_PARAMETERS, max_workers=4):
+    """Loads every parameter of a manifest, returning them by environment variable"""
+
+    time_start = time.perf_counter()
+
+    values = fetch_parameters(ssm_client, [name for _, name in manifest], max_workers)
+
+    log.info("Loaded %s SSM parameters in %.2fs", len(values), time.perf_counter() - time_start)
+
+    return {variable: values[name] for variable, name in manifest}
+
+
+def load_fernet(key):
+    """Returns a Fernet for the key, None when cryptography isn't installed.
+    cryptography is only imported when a warm start file is used"""
+
+    try:
+        from cryptography import fernet
+    except ImportError:
+        log.warning("cryptography isn't installed, secrets won't be kept for a warm start")
+        return None
+
+    return fernet.Fernet(key)
+
+
+class SecretsProvider(object):
+    """Resolves the parameters of a manifest on first access and caches them for ttl seconds.
+    An expired value is still answered while a background thread fetches it again.
+    With a Fernet key the values are also kept encrypted on cache_path, so a restart
+    can start from them without asking SSM. The SSM client is only created when needed"""
+
+    def __init__(self, client_factory, manifest=SSM_PARAMETERS, ttl=SECRETS_TTL,
+                 cache_path=None, cache_key=None, refresh_interval=SECRETS_REFRESH_INTERVAL):
+        self.names = dict(manifest)
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.cache_path = cache_path
+        self.fetches = 0
+        self._client_factory = client_factory
+        self._client = None
+        self._values = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._refresh = threading.Event()
+        self._thread = None
+
+        self._fernet = None
+        if cache_path and cache_key:
+            self._fernet = load_fernet(cache_key)
+            if self._fernet is not None:
+                self.load_warm_start()
+
+    def client(self):
+
+        with self._lock:
+            if self._client is None:
+                self._client = self._client_factory()
+            return self._client
+
+    def fetch(self, variables):
+        """Fetches the given variables from SSM in as few calls as possible"""
+
+        time_start = time.perf_counter()
+        values = fetch_parameters(self.client(), [self.names[variable] for variable in variables])
+        fetched_at = time.time()
+
+        with self._lock:
+            for variable in variables:
+                self._values[variable] = (values[self.names[variable]], fetched_at)
+            self.fetches += 1
+
+        log.info("Fetched %s secrets in %.2fs", len(variables), time.perf_counter() - time_start)
+        self.save_warm_start()
+
+    def load(self, variables):
+        """Returns the values of the given variables, fetching together the ones not cached yet"""
+
+        missing = [variable for variable in variables if variable not in self._values]
+        if missing:
+            self.fetch(missing)
+        self.start()
+
+        if self.stale():
+            self._refresh.set()
+
+        return {variable: self._values[variable][0] for variable in variables}
+
+    def get(self, variable):
+
+        return self.load([variable])[variable]
+
+    def stale(self):
+        """Returns the cached variables older than the ttl"""
+
+        expires = time.time() - self.ttl
+        with self._lock:
+            return [variable for variable, (_, fetched_at) in self._values.items() if fetched_at < expires]
+
+    def start(self):
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="secrets-refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+
+        while True:
+            self._refresh.wait(self.refresh_interval)
+            self._refresh.clear()
+
+            stale = self.stale()
+            if not stale:
+                continue
+            try:
+                self.fetch(stale)
+            except Exception:
+                log.exception("Failed to refresh %s secrets", len(stale))
+
+    def load_warm_start(self):
+        """Starts from the values saved by a previous run, they are refreshed once they expire"""
+
+        from cryptography.fernet import InvalidToken
+
+        try:
+            with open(self.cache_path, 'rb') as cache_file:
+                values = json.loads(self._fernet.decrypt(cache_file.read()))
+        except (IOError, ValueError, InvalidToken):
+            return
+
+        with self._lock:
+            for variable, (value, fetched_at) in values.items():
+                if variable in self.names:
+                    self._values[variable] = (value, fetched_at)
+
+    def save_warm_start(self):
+
+        if self._fernet is None:
+            return
+
+        # Saves from several threads go one at a time, so the newest values are the ones kept
+        with self._save_lock:
+            with self._lock:
+                token = self._fernet.encrypt(json.dumps(self._values).encode())
+
+            try:
+                cache_dir = os.path.dirname(self.cache_path)
+                os.makedirs(cache_dir, exist_ok=True)
+                # mkstemp gives every save its own temp file, created 0600
+                handle, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+                try:
+                    with open(handle, 'wb') as cache_file:
+                        cache_file.write(token)
+                    os.replace(temp_path, self.cache_path)
+                except OSError:
+                    os.unlink(temp_path)
+                    raise
+            except OSError:
+                log.exception("Failed to save the secrets warm start file")
+
+provider = None
+
+
+def install(secrets_provider):
+    """Makes get answer from the given provider"""
+
+    global provider
+    provider = secrets_provider
+    return secrets_provider
+
+
+def get(variable):
+    """Returns a secret of the manifest, from the installed provider or from the environment
+    when there's none, like when the helpers run outside of the bot"""
+
+    if provider is None:
+        return os.environ[variable]
+    return provider.get(variable)
+
+
+def load(variables):
+    """Returns several secrets of the manifest, like get"""
+
+    if provider is None:
+        return {variable: os.environ[variable] for variable in variables}
+    return provider.load(variables)
@@ -0,0 +1,115 @@
+import importlib.machinery
+import os
+import threading
+import time
+
+# Records the import time and memory of every Python module while the bot starts,
+# enabled from config.py with STARTUP_PROFILE=1. Times are inclusive of the modules
+# a module imports, self is the part spent in the module itself
+
+# Modules of the bot plugins live under this directory, the rest are libraries and helpers
+COMMANDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'commands')
+
+started_at = time.perf_counter()
+enabled = False
+
+# Module name: (file, seconds, self seconds, RSS growth in bytes)
+records = {}
+
+# Milestones of the startup: (name, seconds since the profile started, RSS in bytes)
+marks = []
+
+_exec_module = importlib.machinery.SourceFileLoader.exec_module
+_local = threading.local()
+
+
+def rss():
+    """Current resident memory of the process in bytes, 0 where /proc isn't available"""
+
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return 0
+
+
+def _profiled_exec_module(loader, module):
+
+    stack = _local.__dict__.setdefault('stack', [])
+    children = [0.0]
+    stack.append(children)
+
+    rss_before = rss()
+    time_start = time.perf_counter()
+    try:
+        _exec_module(loader, module)
+    finally:
+        elapsed = time.perf_counter() - time_start
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        records[module.__name__] = (
+            getattr(module, '__file__', None), elapsed, elapsed - children[0], rss() - rss_before
+        )
+
+
+def enable(flag=True):
+    """Starts recording the modules imported from now on"""
+
+    global enabled
+    if not flag or enabled:
+        return
+
+    enabled = True
+    importlib.machinery.SourceFileLoader.exec_module = _profiled_exec_module
+    mark('profile enabled')
+
+
+def disable():
+
+    global enabled
+    enabled = False
+    importlib.machinery.SourceFileLoader.exec_module = _exec_module
+
+
+def mark(name):
+    """Records a startup milestone, like the config being loaded or the bot being connected"""
+
+    marks.append((name, time.perf_counter() - started_at, rss()))
+
+
+def is_plugin(path):
+
+    if not path:
+        return False
+    path = os.path.abspath(path)
+    return path.startswith(COMMANDS_DIR) and os.sep + '_helpers' + os.sep not in path
+
+
+def report(limit=15):
+    """Returns the profile as lines of text: the milestones, the plugins and the slowest modules"""
+
+    lines = ["{:<28} {:>8.3f}s {:>8.1f} MB".format(name, seconds, memory / 1024 / 1024) for name, seconds, memory in marks]
+
+    if not enabled and not records:
+        return lines + ["Set STARTUP_PROFILE=1 to profile the imports of the modules and plugins"]
+
+    def format_record(name, record):
+        _, seconds, self_seconds, memory = record
+        return "{:<40} {:>8.3f}s {:>8.3f}s self {:>+8.1f} MB".format(name, seconds, self_seconds, memory / 1024 / 1024)
+
+    plugins = sorted(
+        ((name, record) for name, record in records.items() if is_plugin(record[0])),
+        key=lambda item: -item[1][1]
+    )
+    modules = sorted(records.items(), key=lambda item: -item[1][2])[:limit]
+
+    lines.append("Plugins:")
+    lines.extend(format_record(name, record) for name, record in plugins)
+    lines.append("Slowest modules ({} imported):".format(len(records)))
+    lines.extend(format_record(name, record) for name, record in modules)
+
+    return lines
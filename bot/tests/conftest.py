@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The helpers are imported the way the bot runs them, from the bot directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,173 @@
+import itertools
+import logging
+from types import SimpleNamespace
+
+import pytest
+from errbot.backends.base import RoomOccupant
+from errbot.core_plugins.acls import ACLS, ciglob, glob
+
+import acl
+from commands.accessControl.accessControl import AccessControl
+
+PATTERNS = [
+    '#general', '#team-*', '#ops?', '#[abc]log', '#[!x]y', '@alice', '@*bot', '*', 'a.b', 'x+y', '(p)', '#Mixed'
+]
+
+TEXTS = [
+    '#general', '#general2', '#team-', '#team-web', '#ops', '#ops1', '#ops12', '#alog', '#dlog', '#ay', '#xy',
+    '@alice', '@Alice', '@helpbot', '@bot', 'a.b', 'axb', 'x+y', 'xxy', '(p)', 'p', '#mixed', '#Mixed', '', 'new\nline'
+]
+
+
+@pytest.mark.parametrize('patterns', [[pattern] for pattern in PATTERNS] + [PATTERNS[:6], PATTERNS[1:], PATTERNS])
+def test_matcher_agrees_with_errbot_glob(patterns):
+    matcher = acl.Matcher(patterns)
+    for text in TEXTS:
+        assert (text in matcher) == glob(text, patterns), (text, patterns)
+        # A second lookup is answered from the memoized matches
+        assert (text in matcher) == glob(text, patterns), (text, patterns)
+
+
+@pytest.mark.parametrize('patterns', [[pattern] for pattern in PATTERNS] + [PATTERNS])
+def test_ignore_case_matcher_agrees_with_errbot_ciglob(patterns):
+    matcher = acl.Matcher(patterns, ignore_case=True)
+    for text in TEXTS:
+        assert (text in matcher) == ciglob(text, patterns), (text, patterns)
+
+
+def test_parse_list_and_single_default_rule():
+    controls = acl.access_controls(' #a, #b,,', '@u ,', {'stepTemplate:*': {'allowrooms': ['#releases']}})
+
+    assert list(controls) == ['stepTemplate:*', '*']
+    assert controls['*'] == {'allowrooms': ['#a', '#b'], 'allowusers': ['@u']}
+
+
+class Occupant(RoomOccupant):
+
+    def __init__(self, user, room):
+        self.aclattr = user
+        self._room = room
+
+    @property
+    def person(self):
+        return self.aclattr
+
+    @property
+    def room(self):
+        return self._room
+
+    @property
+    def nick(self):
+        return self.aclattr
+
+    @property
+    def fullname(self):
+        return self.aclattr
+
+    @property
+    def client(self):
+        return None
+
+    def __str__(self):
+        return self.aclattr
+
+
+def make_plugin(plugin_class, bot_config, commands, replies):
+    bot = SimpleNamespace(
+        bot_config=bot_config,
+        all_commands=commands,
+        send_simple_reply=lambda msg, text: replies.append(text)
+    )
+    plugin = plugin_class.__new__(plugin_class)
+    plugin._bot = bot
+    plugin.log = logging.getLogger(__name__)
+    return plugin
+
+
+CONTROLS = [
+    acl.access_controls('#general,#team-*', '@alice,@*bot'),
+    acl.access_controls('#general', '@alice', {
+        'stepTemplate:*': {'allowrooms': ['#releases'], 'allowusers': ['@alice', '@bob']},
+        'wa': {'denyusers': ['@helpbot'], 'allowprivate': False},
+        'botStatus:pools': {'allowmuc': False, 'denyargs': ['secret*']},
+        'admin': {'allowmuc': True}
+    }),
+    {'*': {'denyrooms': ['#random'], 'allowargs': ['', 'ok*']}}
+]
+
+
+@pytest.mark.parametrize('controls', CONTROLS)
+def test_access_rules_agree_with_errbot_acls(controls):
+    commands = {
+        name: SimpleNamespace(__self__=SimpleNamespace(name=plugin), _err_command_admin_only=admin_only)
+        for name, plugin, admin_only in [
+            ('step', 'stepTemplate', False),
+            ('wa', 'wolframAlpha', False),
+            ('pools', 'botStatus', False),
+            ('admin', 'botStatus', True),
+            ('other', 'botStatus', True)
+        ]
+    }
+    bot_config = SimpleNamespace(
+        ACCESS_CONTROLS=controls,
+        ACCESS_CONTROLS_DEFAULT={'allowprivate': True},
+        BOT_ADMINS=('@alice',),
+        HIDE_RESTRICTED_ACCESS=False
+    )
+
+    errbot_replies, replies = [], []
+    errbot_acls = make_plugin(ACLS, bot_config, commands, errbot_replies)
+    access_control = make_plugin(AccessControl, bot_config, commands, replies)
+    access_control.start_poller = lambda *args: None
+    access_control.rules = acl.AccessRules(controls, bot_config.ACCESS_CONTROLS_DEFAULT, bot_config.BOT_ADMINS)
+
+    users = ['@alice', '@bob', '@helpbot', '@eve']
+    rooms = [None, '#general', '#team-web', '#releases', '#random']
+    args_list = ['', 'ok then', 'secret stuff']
+
+    for cmd, user, room, args in itertools.product(commands, users, rooms, args_list):
+        if room is None:
+            msg = SimpleNamespace(frm=SimpleNamespace(aclattr=user, person=user), is_group=False)
+        else:
+            msg = SimpleNamespace(frm=Occupant(user, room), is_group=True)
+
+        expected = errbot_acls.acls(msg, cmd, args, False)
+        assert access_control.check_access(msg, cmd, args, False) == expected, (cmd, user, room, args)
+        assert replies == errbot_replies, (cmd, user, room, args)
+
+
+def test_commands_are_blocked_until_the_rules_are_compiled():
+    replies = []
+    bot_config = SimpleNamespace(BOT_ADMINS=(), HIDE_RESTRICTED_ACCESS=False)
+    access_control = make_plugin(AccessControl, bot_config, {}, replies)
+    msg = SimpleNamespace(frm=SimpleNamespace(aclattr='@alice'), is_group=False)
+
+    assert access_control.check_access(msg, 'step', '', False) == (None, None, None)
+    assert len(replies) == 1
+
+
+def test_reload_picks_up_new_allowed_channels(monkeypatch):
+    monkeypatch.setattr('errbot.BotPlugin.activate', lambda self: None)
+    monkeypatch.setenv('ACL_ALLOWED_CHANNELS', '#general')
+    monkeypatch.setenv('ACL_ALLOWED_USERS', '@alice')
+
+    replies = []
+    commands = {'step': SimpleNamespace(__self__=SimpleNamespace(name='stepTemplate'), _err_command_admin_only=False)}
+    bot_config = SimpleNamespace(
+        ACCESS_CONTROLS=acl.access_controls('#general', '@alice'),
+        ACCESS_CONTROLS_DEFAULT={},
+        BOT_ADMINS=(),
+        HIDE_RESTRICTED_ACCESS=True,
+        ACL_COMMAND_RULES={}
+    )
+    access_control = make_plugin(AccessControl, bot_config, commands, replies)
+    access_control.start_poller = lambda *args: None
+    access_control.activate()
+
+    msg = SimpleNamespace(frm=Occupant('@alice', '#new'), is_group=True)
+    assert access_control.check_access(msg, 'step', '', False) == (None, None, None)
+
+    monkeypatch.setenv('ACL_ALLOWED_CHANNELS', '#general, #new')
+    access_control.reload()
+    assert access_control.check_access(msg, 'step', '', False) == (msg, 'step', '')
+    assert replies == []
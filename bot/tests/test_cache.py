@@ -0,0 +1,88 @@
+import threading
+
+from commands._helpers.cache import CachedSession, LRUCache
+
+
+def test_expire_only_marks_the_given_prefixes():
+    cache = LRUCache()
+    cache.set('https://octopus/api/Spaces-1/actiontemplates/All', 'templates', 60)
+    cache.set('https://octopus/api/projects/all', 'projects', 60)
+
+    cache.expire('https://octopus/api/Spaces-1/actiontemplates')
+
+    assert cache.get('https://octopus/api/Spaces-1/actiontemplates/All') is None
+    assert cache.get('https://octopus/api/projects/all') == 'projects'
+    assert cache.get_entry('https://octopus/api/Spaces-1/actiontemplates/All').value == 'templates'
+
+
+def test_expire_without_prefixes_marks_everything():
+    cache = LRUCache()
+    cache.set('a', 1, 60)
+    cache.set('b', 2, 60)
+
+    cache.expire()
+
+    assert cache.get('a') is None and cache.get('b') is None
+
+
+class Response(object):
+
+    def __init__(self, status_code, content=b'{}', headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = content
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class Session(object):
+    """Answers with an ETag, and with a 304 when it's sent back"""
+
+    def get(self, url, params=None, headers=None, stream=False):
+        if headers.get('If-None-Match') == '"1"':
+            return Response(304)
+        return Response(200, b'{"Items": []}', {'ETag': '"1"'})
+
+
+def test_session_counts_into_the_cache_counters():
+    session = CachedSession(Session(), default_ttl=60, name='test_counters')
+
+    session.get_json('https://octopus/api/projects/all')
+    session.get_json('https://octopus/api/projects/all')
+    session.expire()
+    session.get_json('https://octopus/api/projects/all')
+
+    stats = session.stats()
+    assert (stats['hits'], stats['misses'], stats['revalidated']) == (1, 1, 1)
+
+
+def test_concurrent_hits_are_all_counted():
+    cache = LRUCache()
+    cache.set('key', 'value', 60)
+
+    def hit():
+        for _ in range(10000):
+            cache.get('key')
+            cache.count(hits=1)
+
+    threads = [threading.Thread(target=hit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.stats()['hits'] == 8 * 2 * 10000
+
+
+def test_invalidate_drops_the_url_with_every_params_and_fields():
+    session = CachedSession(Session(), default_ttl=60, name='test_invalidate')
+    url = 'https://octopus/api/projects/Projects-1/releases'
+    session.get_json(url, params={'skip': 0, 'take': 1}, fields=['Id'])
+    session.get_json(url + 'x')
+
+    session.invalidate(url)
+
+    assert len(session.cache) == 1
+    assert session.cache.get_entry(url + 'x') is not None
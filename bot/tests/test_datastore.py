@@ -0,0 +1,98 @@
+import pytest
+
+from commands._helpers.cache import PersistentLRUCache
+from commands._helpers.datastore import DataStore, Table
+from commands._helpers.project_index import PROJECTS_TABLE, ProjectIndex
+from commands._helpers.records import Project
+
+ITEMS = Table('items', [('id', 'text'), ('value', 'json')], ttl=True)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DataStore(str(tmp_path / 'bot.db'))
+
+
+def test_rows_are_written_and_read_back(store):
+    store.put_many(ITEMS, [{'id': 'a', 'value': {'n': 1}}, {'id': 'b', 'value': [1, 2]}], ttl=60)
+
+    assert store.get(ITEMS, 'a')['value'] == {'n': 1}
+    assert store.get(ITEMS, 'b')['value'] == [1, 2]
+    assert store.get(ITEMS, 'c') is None
+
+
+def test_expired_rows_are_skipped_and_purged(store):
+    store.put(ITEMS, {'id': 'old', 'value': 1}, ttl=-1)
+    store.put(ITEMS, {'id': 'new', 'value': 2}, ttl=60)
+
+    assert [row['id'] for row in store.query(ITEMS)] == ['new']
+    assert store.purge_expired(ITEMS) == 1
+    assert store.purge_expired(ITEMS) == 0
+
+
+def test_transaction_commits_once(store):
+    store.define(ITEMS)
+    commits = store.commits
+
+    with store.transaction():
+        store.put(ITEMS, {'id': 'a', 'value': 1}, ttl=60)
+        store.put(ITEMS, {'id': 'b', 'value': 2}, ttl=60)
+        store.delete_keys(ITEMS, ['a'])
+
+    assert store.commits == commits + 1
+    assert [row['id'] for row in store.query(ITEMS)] == ['b']
+
+
+def test_failed_transaction_is_rolled_back(store):
+    store.put(ITEMS, {'id': 'a', 'value': 1}, ttl=60)
+
+    with pytest.raises(ValueError):
+        with store.transaction():
+            store.put(ITEMS, {'id': 'b', 'value': 2}, ttl=60)
+            store.delete_keys(ITEMS, ['a'])
+            raise ValueError("failed")
+
+    assert [row['id'] for row in store.query(ITEMS)] == ['a']
+
+
+def test_persistent_cache_survives_a_restart(store):
+    cache = PersistentLRUCache(store, 'answers', maxsize=4)
+    cache.set('question', 'answer', 60)
+
+    assert PersistentLRUCache(store, 'answers', maxsize=4).get('question') == 'answer'
+
+
+def test_persistent_cache_deletes_the_rows_it_evicts(store):
+    cache = PersistentLRUCache(store, 'answers', maxsize=2)
+    for index in range(5):
+        cache.set(index, index, 60)
+
+    assert sorted(row['key'] for row in store.query(cache.table)) == ['3', '4']
+
+
+def test_persistent_cache_trims_the_table_when_loaded(store):
+    cache = PersistentLRUCache(store, 'answers', maxsize=5)
+    for index in range(5):
+        cache.set(str(index), index, 60 + index)
+
+    cache = PersistentLRUCache(store, 'answers', maxsize=2)
+
+    assert sorted(row['key'] for row in store.query(cache.table)) == ['3', '4']
+    assert cache.get('4') == 4 and cache.get('0') is None
+
+
+def test_project_index_writes_only_the_changes(store):
+    projects = [Project('Projects-1', 'One', 'one', 'ProjectGroups-1', 'Group')]
+    index = ProjectIndex(lambda: list(projects))
+    index.store = store
+    index.load()
+
+    writes = store.writes
+    projects.append(Project('Projects-2', 'Two', 'two', 'ProjectGroups-1', 'Group'))
+    index.load()
+    assert store.writes == writes + 1
+
+    projects.pop(0)
+    index.load()
+    assert [row['id'] for row in store.query(PROJECTS_TABLE)] == ['Projects-2']
+    assert index.get('one') is None and index.get('Two').id == 'Projects-2'
@@ -0,0 +1,71 @@
+import pytest
+import requests
+
+from benchmarks.fake_octopus import FakeOctopus
+from commands._helpers import octopus
+from commands._helpers.json_decode import select_fields
+
+PROJECTS_PATH = "/api/projectgroups/ProjectGroups-63/projects"
+
+
+class FakeSession(object):
+    """Serves the payloads of FakeOctopus in place of the cached session, recording the pages asked for"""
+
+    def __init__(self, fake_octopus, failing=()):
+        self.fake_octopus = fake_octopus
+        self.failing = failing
+        self.requests = []
+
+    def get_json(self, url, params=None, fields=None, parse=None, **kwargs):
+        path = url[len(octopus.OCTOPUS_API_URL):]
+        params = {key: str(value) for key, value in (params or {}).items()}
+        self.requests.append((path, int(params.get("skip", 0)), int(params.get("take", 30))))
+        if path in self.failing:
+            raise requests.HTTPError("404 Client Error: Not Found for url: {}".format(url))
+        data = self.fake_octopus.route(path, params)
+        return select_fields(data, fields, parse) if fields or parse else data
+
+
+@pytest.fixture
+def session(monkeypatch):
+    # 200 projects over the 4 groups, 50 in each
+    session = FakeSession(FakeOctopus(projects=200))
+    monkeypatch.setattr(octopus, "cached_session", session)
+    return session
+
+
+def collect(**kwargs):
+    return [item["Id"] for item in octopus.iter_collection(octopus.OCTOPUS_API_URL + PROJECTS_PATH, **kwargs)]
+
+
+def test_every_page_is_followed(session):
+    items = collect(page_size=20)
+
+    assert len(items) == len(set(items)) == 50
+    assert session.requests == [(PROJECTS_PATH, 0, 20), (PROJECTS_PATH, 20, 20), (PROJECTS_PATH, 40, 20)]
+
+
+def test_take_stops_at_the_items_asked_for(session):
+    items = collect(take=25, page_size=20)
+
+    assert len(items) == 25
+    assert session.requests == [(PROJECTS_PATH, 0, 20), (PROJECTS_PATH, 20, 5)]
+
+
+def test_pages_are_only_requested_when_consumed(session):
+    items = octopus.iter_collection(octopus.OCTOPUS_API_URL + PROJECTS_PATH, page_size=20)
+
+    assert session.requests == []
+    next(items)
+    assert len(session.requests) == 1
+
+
+def test_a_failed_project_does_not_abort_the_release_statuses(monkeypatch):
+    session = FakeSession(FakeOctopus(projects=8), failing={"/api/projects/Projects-4/releases"})
+    monkeypatch.setattr(octopus, "cached_session", session)
+
+    statuses = {status.project.id: status for status in octopus.get_release_statuses(max_workers=4)}
+
+    assert len(statuses) == 8
+    assert "404" in statuses["Projects-4"].error
+    assert statuses["Projects-0"].error is None and statuses["Projects-0"].phases
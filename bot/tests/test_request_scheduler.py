@@ -0,0 +1,136 @@
+from commands._helpers.request_scheduler import AdaptiveLimiter, RequestScheduler, TokenBucket
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_limiter(clock, max_concurrency=16):
+    limiter = AdaptiveLimiter(max_concurrency, min_concurrency=2, latency_target=1.0, backoff_factor=0.5, clock=clock)
+    for _ in range(max_concurrency):
+        limiter.acquire()
+    return limiter
+
+
+def test_slow_responses_sent_together_cut_once():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+
+    # A latency spike hits every request in flight
+    clock.now += 3
+    for _ in range(16):
+        limiter.release(latency=3)
+
+    assert limiter.cuts == 1
+    assert limiter.limit == 8
+    assert limiter.in_flight == 0
+
+
+def test_slow_responses_sent_after_a_cut_cut_again():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+
+    clock.now += 3
+    for _ in range(16):
+        limiter.release(latency=3)
+
+    limiter.acquire()
+    clock.now += 2
+    limiter.release(latency=2)
+
+    assert limiter.cuts == 2
+    assert limiter.limit == 4
+
+
+def test_throttled_responses_cut_down_to_min():
+    clock = FakeClock()
+    limiter = make_limiter(clock, max_concurrency=4)
+
+    # Each throttled response was sent after the previous cut
+    for _ in range(4):
+        clock.now += 0.1
+        limiter.release(latency=0.05, throttled=True)
+
+    assert limiter.cuts == 4
+    assert limiter.limit == 2
+
+
+def test_fast_responses_grow_the_limit_up_to_max():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+
+    clock.now += 3
+    limiter.release(latency=3)
+    assert limiter.limit == 8
+
+    grown = []
+    for _ in range(15):
+        limiter.release(latency=0.1)
+        grown.append(limiter.limit)
+
+    # Additive increase, about one per limit responses
+    assert grown == sorted(grown)
+    assert 8 < limiter.limit < 10
+
+    for _ in range(200):
+        limiter.acquire()
+        limiter.release(latency=0.1)
+    assert limiter.limit == 16
+
+
+def test_token_bucket_allows_a_burst_then_waits_for_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+    bucket.acquire()
+    assert clock.sleeps == [0.5]
+
+
+def test_token_bucket_refills_up_to_its_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+
+    # An idle minute refills the burst, not 120 tokens
+    clock.now += 60
+    for _ in range(4):
+        bucket.acquire()
+
+    assert clock.sleeps == [0.5]
+
+
+class Response(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_retried_responses_are_closed():
+    responses = [Response(503), Response(429), Response(200)]
+    sent = iter(responses)
+    scheduler = RequestScheduler(rate=1000, backoff_base=0)
+
+    response = scheduler.request(lambda: next(sent), "https://octopus/api/projects/all")
+
+    assert response is responses[2] and not response.closed
+    assert responses[0].closed and responses[1].closed
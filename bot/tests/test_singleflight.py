@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from commands._helpers import singleflight, warm_cache
+
+
+def run_together(count, target):
+    """Runs target(index) on count threads started together, returning their results or exceptions"""
+
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(index):
+        barrier.wait()
+        try:
+            results[index] = target(index)
+        except Exception as error:
+            results[index] = error
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_are_merged_into_one():
+    group = singleflight.Group('test_merge')
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return ['result']
+
+    results = run_together(5, lambda index: group.do('key', compute))
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert group.stats() == {'calls': 5, 'merged': 4, 'in_flight': 0}
+
+
+def test_calls_of_different_keys_or_after_the_flight_run_again():
+    group = singleflight.Group('test_keys')
+
+    assert run_together(2, lambda index: group.do(index, lambda: index)) == [0, 1]
+    assert group.do('key', lambda: 1) == 1
+    assert group.do('key', lambda: 2) == 2
+    assert group.merged == 0
+
+
+def test_merged_callers_raise_their_own_copy_of_the_error():
+    group = singleflight.Group('test_errors')
+
+    def compute():
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    errors = run_together(4, lambda index: group.do('key', compute))
+
+    assert all(isinstance(error, ValueError) and str(error) == "boom" for error in errors)
+    assert len(set(map(id, errors))) == 4
+    leaders = [error for error in errors if error.__cause__ is None]
+    assert len(leaders) == 1
+    assert all(error.__cause__ is leaders[0] for error in errors if error is not leaders[0])
+
+
+def test_error_is_not_kept_for_the_next_call():
+    group = singleflight.Group('test_retry')
+
+    with pytest.raises(ValueError):
+        group.do('key', lambda: int('x'))
+    assert group.do('key', lambda: 1) == 1
+
+
+def test_warm_cache_calls_the_callbacks_of_every_merged_caller():
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute(fresh, on_progress=None):
+        started.set()
+        release.wait(5)
+        on_progress(1, 1)
+        return 'report'
+
+    warm_cache.register('test_report', compute, 60, callbacks=('on_progress',))
+    progress = [[], [], []]
+
+    def refresh(index):
+        if index:
+            started.wait(5)
+            time.sleep(0.1)
+            threading.Timer(0.2, release.set).start()
+        return warm_cache.refresh('test_report', True, on_progress=lambda *args: progress[index].append(args))
+
+    results = run_together(3, refresh)
+
+    assert [value for value, _ in results] == ['report'] * 3
+    assert progress == [[(1, 1)], [(1, 1)], [(1, 1)]]
+    assert warm_cache._subscribers == {}
@@ -0,0 +1,59 @@
+from concurrent.futures import Future
+
+from requests.structures import CaseInsensitiveDict
+
+from commands._helpers.slack import OutboundCall, OutboundLane, OutboundQueue, SlackWebClient
+
+
+def message(text, merge=True):
+    """A chat.postMessage call built the way OutboundQueue.put builds it, without starting a sender"""
+
+    kwargs = {'channel': 'C1', 'text': text, 'blocks': [{'type': 'section', 'text': {'type': 'mrkdwn', 'text': text}}]}
+    return OutboundCall('token', 'chat.postMessage', kwargs, Future(), merge)
+
+
+def make_lane(queue, calls):
+    lane = OutboundLane(('token', 'chat.postMessage', 'C1'), None, queue._lock)
+    lane.pending.extend(calls)
+    return lane
+
+
+def test_messages_to_the_same_thread_are_merged():
+    queue = OutboundQueue()
+    lane = make_lane(queue, [message('one'), message('two')])
+
+    assert len(queue._take_batch(lane)) == 2
+
+
+def test_a_placeholder_is_never_merged():
+    queue = OutboundQueue()
+    placeholder = message('Checking...', merge=False)
+
+    lane = make_lane(queue, [placeholder, message('report'), message('other report')])
+    assert queue._take_batch(lane) == [placeholder]
+    assert len(queue._take_batch(lane)) == 2
+
+    lane = make_lane(queue, [message('report'), placeholder])
+    assert len(queue._take_batch(lane)) == 1
+    assert queue._take_batch(lane) == [placeholder]
+
+
+class RateLimitedSession(object):
+
+    class Response(object):
+        headers = CaseInsensitiveDict({'retry-after': '3'})
+
+        def json(self):
+            return {'ok': False, 'error': 'ratelimited'}
+
+    def post(self, url, data=None, timeout=None):
+        return self.Response()
+
+
+def test_retry_after_is_read_whatever_its_case():
+    client = SlackWebClient('token')
+    client.session = RateLimitedSession()
+
+    response = client.api_call('chat.postMessage', channel='C1', text='text')
+
+    assert response['headers'].get('Retry-After') == '3'